@@ -1,11 +1,15 @@
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+from uuid import UUID
 from jose import jwt, JWTError
 from fastapi import HTTPException, Depends, Header
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models import Doctor
-from db import engine
+from db import get_session
 import os
 from dotenv import load_dotenv
 
@@ -15,17 +19,58 @@ security = HTTPBearer()
 SECRET_KEY = os.getenv("JWT_TOKEN")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Authenticated doctors are kept in memory for AUTH_CACHE_TTL seconds, at most
+# AUTH_CACHE_SIZE of them, so most requests never query the doctor table.
+# The cache and invalidate() are per process: with several uvicorn workers, the
+# others keep serving a changed username or email from older tokens' claims
+# until those tokens expire (ACCESS_TOKEN_EXPIRE_MINUTES).
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+_cache: OrderedDict[str, tuple[float, Doctor]] = OrderedDict()
+# Claims of tokens issued at or before this time (per doctor) are not trusted.
+_stale_before: dict[str, float] = {}
+stats = {"hits": 0, "claim_hits": 0, "misses": 0}
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode["exp"] = expire
+    to_encode.setdefault("iat", time.time())
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_doctor(token: str = Depends(oauth2_scheme)) -> Doctor:
+def create_doctor_token(doctor: Doctor) -> str:
+    """Access token whose claims carry the doctor's identity, so it can be authenticated without the DB."""
+    sub = str(doctor.id)
+    # Issued strictly after any invalidation cutoff, even within the same clock tick, so its claims are trusted.
+    iat = max(time.time(), _stale_before.get(sub, 0.0) + 0.001)
+    return create_access_token(data={"sub": sub, "username": doctor.username, "email": doctor.email, "iat": iat})
+
+def invalidate(doctor_id) -> None:
+    """Forget a doctor's cached identity and stop trusting the claims of tokens issued so far."""
+    sub = str(doctor_id)
+    _cache.pop(sub, None)
+    _stale_before[sub] = time.time()
+
+def _remember(sub: str, doctor: Doctor):
+    _cache[sub] = (time.monotonic() + AUTH_CACHE_TTL, doctor)
+    _cache.move_to_end(sub)
+    while len(_cache) > AUTH_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+def _from_claims(payload: dict) -> Optional[Doctor]:
+    sub = payload["sub"]
+    if "username" not in payload or "email" not in payload:
+        return None
+    stale_before = _stale_before.get(sub)
+    if stale_before is not None and payload.get("iat", 0) <= stale_before:
+        return None
+    return Doctor(id=UUID(sub), username=payload["username"], email=payload["email"], hashed_password="")
+
+async def get_current_doctor(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)) -> Doctor:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         doctor_id: str = payload.get("sub")
@@ -34,8 +79,29 @@ def get_current_doctor(token: str = Depends(oauth2_scheme)) -> Doctor:
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    with Session(engine) as session:
-        doctor = session.exec(select(Doctor).where(Doctor.id == doctor_id)).first()
-        if doctor is None:
-            raise HTTPException(status_code=404, detail="Doctor not found")
+    cached = _cache.get(doctor_id)
+    if cached and cached[0] > time.monotonic():
+        _cache.move_to_end(doctor_id)
+        stats["hits"] += 1
+        return cached[1]
+
+    doctor = _from_claims(payload)
+    if doctor is not None:
+        stats["claim_hits"] += 1
+        _remember(doctor_id, doctor)
         return doctor
+
+    stats["misses"] += 1
+    doctor = (await session.exec(select(Doctor).where(Doctor.id == UUID(doctor_id)))).first()
+    if doctor is None:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    _remember(doctor_id, doctor)
+    return doctor
+
+def snapshot() -> dict:
+    lookups = stats["hits"] + stats["claim_hits"] + stats["misses"]
+    return {
+        **stats,
+        "entries": len(_cache),
+        "hit_rate": round((lookups - stats["misses"]) / lookups, 4) if lookups else None,
+    }
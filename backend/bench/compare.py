@@ -0,0 +1,43 @@
+"""
+Compare two bench.run result files. Exits with status 1 when any scenario's
+p95 latency grew, or its throughput fell, by more than --threshold percent.
+
+    python -m bench.compare baseline.json results.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+def compare(baseline: dict, current: dict, threshold: float) -> tuple[list[str], bool]:
+    lines = [f"{'scenario':<20} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'rps':>18}"]
+    regressed = False
+    for name, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            lines.append(f"{name:<20} (not in baseline)")
+            continue
+        cells = []
+        for key in ["p50_ms", "p95_ms", "p99_ms", "throughput_rps"]:
+            cells.append(f"{after[key]:>9} ({_change(before[key], after[key]):+6.1f}%)")
+        slower = _change(before["p95_ms"], after["p95_ms"]) > threshold
+        fewer = -_change(before["throughput_rps"], after["throughput_rps"]) > threshold
+        regressed |= slower or fewer
+        lines.append(f"{name:<20} {' '.join(cells)}{'  REGRESSED' if slower or fewer else ''}")
+    return lines, regressed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed change in percent")
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    lines, regressed = compare(baseline, current, args.threshold)
+    print("\n".join(lines))
+    sys.exit(1 if regressed else 0)
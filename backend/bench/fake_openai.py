@@ -0,0 +1,92 @@
+"""
+OpenAI-compatible stand-in for benchmarks. Serves /v1/chat/completions, plain
+and streamed, with configurable latency, so load runs never reach the real API.
+
+    python -m bench.fake_openai --port 9100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from uuid import uuid4
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Seconds before the first token (normally distributed), and between tokens.
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.1"))
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.005"))
+# Completion length cap, and the share of requests answered with a 503.
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "200"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+WORDS = ["patient", "presents", "with", "history", "of", "diabetes", "hypertension", "and", "chest", "pain", "recommend", "follow-up"]
+
+app = FastAPI()
+
+def _usage(messages: list[dict], completion_tokens: int) -> dict:
+    prompt_tokens = sum(len((m.get("content") or "").split()) for m in messages)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason: str | None = None) -> str:
+    return "data: " + json.dumps({
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < FAKE_LLM_ERROR_RATE:
+        return JSONResponse({"error": {"message": "Fake overload", "type": "server_error"}}, status_code=503)
+
+    model = body.get("model", "gpt-3.5-turbo")
+    messages = body.get("messages", [])
+    count = min(body.get("max_tokens") or FAKE_LLM_TOKENS, FAKE_LLM_TOKENS)
+    tokens = [random.choice(WORDS) + " " for _ in range(count)]
+    completion_id = f"chatcmpl-{uuid4().hex}"
+    await asyncio.sleep(max(0.0, random.gauss(FAKE_LLM_LATENCY, FAKE_LLM_JITTER)))
+
+    if not body.get("stream"):
+        await asyncio.sleep(FAKE_LLM_TOKEN_DELAY * count)
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": _usage(messages, count),
+        })
+
+    async def events():
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for token in tokens:
+            if FAKE_LLM_TOKEN_DELAY:
+                await asyncio.sleep(FAKE_LLM_TOKEN_DELAY)
+            yield _chunk(completion_id, model, {"content": token})
+        yield _chunk(completion_id, model, {}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": _usage(messages, count),
+            }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
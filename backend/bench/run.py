@@ -0,0 +1,300 @@
+"""
+Drive the API at a fixed concurrency and report latency percentiles and
+throughput per scenario as JSON. By default it boots the fake OpenAI server
+and the app itself against DATABASE_URL, which must hold data from bench.seed.
+
+    python -m bench.run --concurrency 32 --duration 30 --output results.json
+    python -m bench.compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+import httpx
+import keywords
+from bench.seed import BENCH_PASSWORD, doctor_email
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+####### Scenarios #######
+
+class Context:
+    """Logged-in bench doctors and ids to pick request parameters from."""
+
+    def __init__(self, doctors: list[dict], vocabulary: list[str]):
+        self.doctors = doctors
+        self.vocabulary = vocabulary
+
+    def doctor(self) -> dict:
+        return random.choice(self.doctors)
+
+    def headers(self, doctor: dict) -> dict:
+        return {"Authorization": f"Bearer {doctor['token']}"}
+
+async def login(client: httpx.AsyncClient, ctx: Context):
+    doctor = ctx.doctor()
+    return await client.post("/login", json={"email": doctor["email"], "password": BENCH_PASSWORD})
+
+async def summaries(client: httpx.AsyncClient, ctx: Context):
+    return await client.get("/summaries", params={"per_page": 20}, headers=ctx.headers(ctx.doctor()))
+
+async def summaries_filtered(client: httpx.AsyncClient, ctx: Context):
+    doctor = ctx.doctor()
+    params = random.choice([
+        {"keyword": random.choice(ctx.vocabulary)},
+        {"file_name": f"record-{random.randint(0, 999)}"},
+        {"patient_id": random.choice(doctor["patient_ids"])},
+    ])
+    response = await client.get("/summaries", params={"per_page": 20, **params}, headers=ctx.headers(doctor))
+    next_cursor = response.json().get("next_cursor") if response.status_code == 200 else None
+    if next_cursor:
+        response = await client.get("/summaries", params={"per_page": 20, "cursor": next_cursor, **params}, headers=ctx.headers(doctor))
+    return response
+
+async def dashboard_stats(client: httpx.AsyncClient, ctx: Context):
+    return await client.get("/dashboard-stats", headers=ctx.headers(ctx.doctor()))
+
+async def export_pdf(client: httpx.AsyncClient, ctx: Context):
+    doctor = ctx.doctor()
+    return await client.get(f"/export-pdf/{random.choice(doctor['summary_ids'])}", headers=ctx.headers(doctor))
+
+async def export_bulk(client: httpx.AsyncClient, ctx: Context):
+    doctor = ctx.doctor()
+    params = {"patient_id": random.choice(doctor["patient_ids"]), "format": "ndjson"}
+    async with client.stream("GET", "/export", params=params, headers=ctx.headers(doctor)) as response:
+        async for _ in response.aiter_bytes():
+            pass
+    return response
+
+async def search(client: httpx.AsyncClient, ctx: Context):
+    doctor = ctx.doctor()
+    params = random.choice([
+        {"q": random.choice(ctx.vocabulary)},
+        {"q": f'"{random.choice(ctx.vocabulary)}"'},
+        {"q": " OR ".join(random.sample(ctx.vocabulary, 2))},
+        {"q": random.choice(ctx.vocabulary), "patient_id": random.choice(doctor["patient_ids"])},
+    ])
+    response = await client.get("/search", params={"per_page": 20, **params}, headers=ctx.headers(doctor))
+    next_cursor = response.json().get("next_cursor") if response.status_code == 200 else None
+    if next_cursor:
+        response = await client.get("/search", params={"per_page": 20, "cursor": next_cursor, **params}, headers=ctx.headers(doctor))
+    return response
+
+async def generate_summary(client: httpx.AsyncClient, ctx: Context):
+    """Upload a unique document and wait for its job, so the time covers extraction, the LLM and the insert."""
+    doctor = ctx.doctor()
+    terms = random.sample(ctx.vocabulary, 3)
+    document = f"Bench document {uuid.uuid4()}. Patient reports {', '.join(terms)}.\n" * 20
+    response = await client.post(
+        "/generate-summary",
+        files={"file": ("bench.txt", document.encode(), "text/plain")},
+        data={"patient_id": random.choice(doctor["patient_ids"])},
+        headers=ctx.headers(doctor),
+    )
+    if response.status_code != 202:
+        return response
+    job_id = response.json()["job_id"]
+    while True:
+        await asyncio.sleep(0.05)
+        response = await client.get(f"/jobs/{job_id}", headers=ctx.headers(doctor))
+        if response.status_code != 200 or response.json()["status"] in ("succeeded", "failed"):
+            return response
+
+SCENARIOS = {
+    "login": login,
+    "summaries": summaries,
+    "summaries_filtered": summaries_filtered,
+    "dashboard_stats": dashboard_stats,
+    "export_pdf": export_pdf,
+    "export_bulk": export_bulk,
+    "search": search,
+    "generate_summary": generate_summary,
+}
+
+####### Driver #######
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+def report(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+    }
+
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, scenario, concurrency: int, duration: float, warmup: float) -> dict:
+    """Run `concurrency` closed-loop workers; requests finishing inside the warm-up are not counted."""
+    latencies: list[float] = []
+    errors = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            request_started = time.perf_counter()
+            try:
+                response = await scenario(client, ctx)
+                failed = response.status_code >= 400 or (response.status_code == 200 and _job_failed(response))
+            except httpx.HTTPError:
+                failed = True
+            finished = time.perf_counter()
+            if finished < measure_from:
+                continue
+            latencies.append(finished - request_started)
+            errors += failed
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return report(latencies, errors, time.perf_counter() - measure_from)
+
+def _job_failed(response: httpx.Response) -> bool:
+    if "/jobs/" not in response.request.url.path:
+        return False
+    return response.json().get("status") == "failed"
+
+async def _check_not_empty(client: httpx.AsyncClient, headers: dict, doctor: dict):
+    """Fail before measuring if a patient-scoped request returns nothing; its latency would not mean anything."""
+    patient_id = doctor["patient_ids"][0]
+    response = await client.get("/export", params={"patient_id": patient_id, "format": "ndjson"}, headers=headers)
+    if response.status_code != 200 or not response.content.strip():
+        raise SystemExit(f"/export for patient {patient_id} of {doctor['email']} is empty; reseed with more summaries than patients.")
+    response = await client.get("/summaries", params={"patient_id": patient_id, "per_page": 1}, headers=headers)
+    if response.status_code != 200 or not response.json()["summaries"]:
+        raise SystemExit(f"/summaries for patient {patient_id} of {doctor['email']} is empty; reseed with more summaries than patients.")
+
+async def prepare(client: httpx.AsyncClient, doctors: int) -> Context:
+    logged_in = []
+    for i in range(doctors):
+        response = await client.post("/login", json={"email": doctor_email(i), "password": BENCH_PASSWORD})
+        if response.status_code != 200:
+            break
+        doctor = {"email": doctor_email(i), "token": response.json()["access_token"]}
+        headers = {"Authorization": f"Bearer {doctor['token']}"}
+        # Exports and searches are scoped to the doctor, so only their own patients give non-empty responses.
+        doctor["patient_ids"] = [p["id"] for p in (await client.get("/patients/options", headers=headers)).json()]
+        doctor["summary_ids"] = [s["id"] for s in (await client.get("/summaries", params={"per_page": 100}, headers=headers)).json()["summaries"]]
+        if doctor["patient_ids"] and doctor["summary_ids"]:
+            await _check_not_empty(client, headers, doctor)
+            logged_in.append(doctor)
+    if not logged_in:
+        raise SystemExit("No bench doctors could log in; seed the database with `python -m bench.seed` first.")
+    return Context(logged_in, keywords.load_vocabulary(keywords.KEYWORDS_FILE))
+
+####### Processes #######
+
+def _start(args: list[str], env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "ab")
+    return subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+async def _wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main(args) -> dict:
+    processes = []
+    url = args.url
+    started_at = datetime.now(timezone.utc).isoformat()
+    try:
+        if not url:
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+                "OPENAI_API_KEY": "bench",
+                "LOG_SAMPLE_RATE": env.get("LOG_SAMPLE_RATE", "0"),
+            })
+            processes.append(_start(["-m", "bench.fake_openai", "--port", str(args.llm_port)], env, args.log))
+            processes.append(_start([
+                "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+            ], env, args.log))
+            url = f"http://127.0.0.1:{args.port}"
+            await _wait_ready(f"http://127.0.0.1:{args.llm_port}/docs")
+            await _wait_ready(url + "/")
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+            ctx = await prepare(client, args.doctors)
+            results = {}
+            for name in args.scenarios:
+                print(f"Running {name} at concurrency {args.concurrency} for {args.duration:.0f}s", file=sys.stderr)
+                results[name] = await run_scenario(client, ctx, SCENARIOS[name], args.concurrency, args.duration, args.warmup)
+                print(f"  {json.dumps(results[name])}", file=sys.stderr)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    return {
+        "meta": {
+            "started_at": started_at,
+            "git_commit": _git_commit(),
+            "url": url,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "workers": args.workers if not args.url else None,
+            "fake_llm_latency_s": float(os.getenv("FAKE_LLM_LATENCY", "0.5")) if not args.url else None,
+            "python": platform.python_version(),
+        },
+        "scenarios": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS),
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before each scenario")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--doctors", type=int, default=10, help="bench doctors to spread requests over")
+    parser.add_argument("--url", help="benchmark an already running app instead of booting one")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=9100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--log", default="bench.log", help="where the booted processes write their output")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
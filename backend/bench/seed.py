@@ -0,0 +1,111 @@
+"""
+Seed synthetic doctors, patients and summaries for benchmarks, using COPY so
+a million summaries load in minutes. Postgres only.
+
+    python -m bench.seed --doctors 10 --patients 1000 --summaries 1000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+from sqlalchemy import text
+from db import engine, init_db
+from models import Doctor
+import keywords
+
+BENCH_PASSWORD = "bench-password"
+BATCH_ROWS = 50_000
+
+def doctor_email(i: int) -> str:
+    return f"bench-doctor-{i}@example.com"
+
+async def _copy(conn, table: str, columns: list[str], records: list[tuple]):
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+async def reset(conn):
+    """Delete every bench doctor and all of their data."""
+    bench_doctors = "SELECT id FROM doctor WHERE email LIKE 'bench-doctor-%@example.com'"
+    for table in ["job", "summary", "patient"]:
+        await conn.execute(text(f"DELETE FROM {table} WHERE doctor_id IN ({bench_doctors})"))
+    await conn.execute(text(f"DELETE FROM doctor WHERE id IN ({bench_doctors})"))
+
+async def seed(doctors: int, patients: int, summaries: int, diagnosed: float, feedback: float, days: int):
+    await init_db()
+    vocabulary = keywords.load_vocabulary(keywords.KEYWORDS_FILE)
+    hashed_password = Doctor.hash_password(BENCH_PASSWORD)
+    now = datetime.now(timezone.utc)
+
+    def created_at():
+        return now - timedelta(seconds=random.randint(0, days * 86400))
+
+    async with engine.begin() as conn:
+        existing = (await conn.execute(text("SELECT count(*) FROM doctor WHERE email LIKE 'bench-doctor-%@example.com'"))).scalar()
+        if existing:
+            raise SystemExit(f"{existing} bench doctors already exist; run with --reset to replace them.")
+
+        doctor_ids = [uuid4() for _ in range(doctors)]
+        await _copy(conn, "doctor", ["id", "username", "email", "hashed_password"], [
+            (doctor_id, f"bench-doctor-{i}", doctor_email(i), hashed_password) for i, doctor_id in enumerate(doctor_ids)
+        ])
+
+        patient_rows = [
+            (uuid4(), doctor_ids[i % doctors], f"Patient {i}", random.randint(1, 95), random.choice(["male", "female"]), f"+1555{i:07d}", created_at())
+            for i in range(patients)
+        ]
+        await _copy(conn, "patient", ["id", "doctor_id", "name", "age", "gender", "contact", "created_at"], patient_rows)
+
+    started = time.perf_counter()
+    for offset in range(0, summaries, BATCH_ROWS):
+        summary_rows, keyword_rows, diagnosis_rows, feedback_rows = [], [], [], []
+        for i in range(offset, min(offset + BATCH_ROWS, summaries)):
+            summary_id = uuid4()
+            patient_id, doctor_id = patient_rows[i % patients][:2]
+            terms = random.sample(vocabulary, random.randint(1, 5))
+            created = created_at()
+            summary_rows.append((
+                summary_id, patient_id, doctor_id, f"record-{i}.pdf",
+                ("Synthetic record mentioning " + ", ".join(terms) + ". ") * 40,
+                "Patient with " + ", ".join(terms) + ".",
+                json.dumps([term.capitalize() for term in terms]), None, created,
+            ))
+            keyword_rows.extend((summary_id, term.lower()) for term in terms)
+            if random.random() < diagnosed:
+                diagnosis_rows.append((uuid4(), summary_id, "Consider " + terms[0] + ".", created))
+            if random.random() < feedback:
+                feedback_rows.append((uuid4(), summary_id, random.random() < 0.8, None, created))
+
+        async with engine.begin() as conn:
+            await _copy(conn, "summary", ["id", "patient_id", "doctor_id", "file_name", "raw_text", "summary", "keywords", "notes", "created_at"], summary_rows)
+            await _copy(conn, "summarykeyword", ["summary_id", "keyword"], keyword_rows)
+            await _copy(conn, "diagnosis", ["id", "summary_id", "result", "created_at"], diagnosis_rows)
+            await _copy(conn, "feedback", ["id", "summary_id", "helpful", "comment", "created_at"], feedback_rows)
+        done = offset + len(summary_rows)
+        print(f"{done}/{summaries} summaries ({done / (time.perf_counter() - started):.0f}/s)")
+
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE"))
+
+async def _main(args):
+    if args.reset:
+        await init_db()
+        async with engine.begin() as conn:
+            await reset(conn)
+    await seed(args.doctors, args.patients, args.summaries, args.diagnosed, args.feedback, args.days)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=10)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--summaries", type=int, default=100_000)
+    parser.add_argument("--diagnosed", type=float, default=0.5, help="share of summaries with a current diagnosis")
+    parser.add_argument("--feedback", type=float, default=0.1, help="share of summaries with feedback")
+    parser.add_argument("--days", type=int, default=730, help="spread created_at over this many days")
+    parser.add_argument("--reset", action="store_true", help="delete existing bench doctors and their data first")
+    args = parser.parse_args()
+    random.seed(0)
+    asyncio.run(_main(args))
@@ -0,0 +1,67 @@
+from uuid import UUID
+from sqlalchemy import literal_column, union_all
+from sqlalchemy.orm import defer
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Summary, Diagnosis, DiagnosisHistory, RecommendationHistory, Feedback
+
+SECTIONS = {"summary", "diagnosis", "diagnosis_history", "recommendations", "feedback"}
+# Returned only when asked for by name.
+HEAVY_FIELDS = {"raw_text"}
+
+def _history_item(row) -> dict:
+    return {"id": str(row.id), "result": row.result, "created_at": row.created_at.isoformat()}
+
+async def load_case(session: AsyncSession, summary_id: UUID, fields: set[str], history_limit: int) -> dict | None:
+    """
+    Everything the summary details page shows, in at most three queries: the
+    summary joined to its current diagnosis, both histories in one UNION ALL,
+    and the feedback. fields picks the sections (and heavy summary columns)
+    to return. Returns None when the summary does not exist.
+    """
+    query = select(Summary, Diagnosis).outerjoin(Diagnosis, Diagnosis.summary_id == Summary.id).where(Summary.id == summary_id)
+    if "raw_text" not in fields:
+        query = query.options(defer(Summary.raw_text))
+    row = (await session.exec(query)).first()
+    if row is None:
+        return None
+    summary, diagnosis = row
+
+    case = {}
+    if "summary" in fields:
+        exclude = HEAVY_FIELDS - fields
+        case["summary"] = summary.dict(exclude=exclude)
+    if "diagnosis" in fields:
+        case["diagnosis"] = (
+            {"diagnosis": diagnosis.result, "created_at": diagnosis.created_at.isoformat()}
+            if diagnosis else {"diagnosis": None}
+        )
+
+    wanted = [
+        (name, model) for name, model in [("diagnosis_history", DiagnosisHistory), ("recommendations", RecommendationHistory)]
+        if name in fields
+    ]
+    if wanted:
+        branches = [
+            select(literal_column(f"'{name}'").label("kind"), model.id, model.result, model.created_at)
+            .where(model.summary_id == summary_id)
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(history_limit)
+            .subquery()
+            for name, model in wanted
+        ]
+        histories = union_all(*[select(*branch.c) for branch in branches])
+        for name, _ in wanted:
+            case[name] = []
+        for history in (await session.exec(histories)).all():
+            case[history.kind].append(_history_item(history))
+        for name, _ in wanted:
+            case[name].sort(key=lambda item: item["created_at"], reverse=True)
+
+    if "feedback" in fields:
+        feedback = (await session.exec(
+            select(Feedback).where(Feedback.summary_id == summary_id).order_by(Feedback.created_at.desc())
+        )).first()
+        case["feedback"] = feedback
+
+    return case
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+from uuid import UUID
+from sqlalchemy.orm import defer
+from sqlmodel import select
+from db import async_session
+from models import Summary
+import extraction
+import keywords
+import metrics
+import search_index
+import stats
+import summarizer
+
+# Documents of one batch summarized at once, and the size limits of a batch.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "200"))
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_BYTES", str(500 * 1024 * 1024)))
+
+def extract_keywords(file_text: str) -> list[str]:
+    with metrics.keyword_scan_duration.time():
+        found_keywords = keywords.extractor.extract(file_text)
+    if not found_keywords:
+        found_keywords = [search_index.NO_KEYWORDS]
+    return found_keywords
+
+async def find_duplicates(patient_id, doctor_id, hashes: list[str]) -> dict[str, Summary]:
+    """Existing summaries of byte-identical documents for this patient, keyed by content hash."""
+    if not hashes:
+        return {}
+    async with async_session() as session:
+        summaries = (await session.exec(
+            select(Summary)
+            .options(defer(Summary.raw_text))
+            .where(
+                Summary.patient_id == UUID(str(patient_id)),
+                Summary.doctor_id == doctor_id,
+                Summary.content_hash.in_(hashes),
+            )
+            .order_by(Summary.created_at.desc())
+        )).all()
+        duplicates = {}
+        for summary in summaries:
+            duplicates.setdefault(summary.content_hash, summary)
+        return duplicates
+
+def build_summary(patient_id, file_name, file_text, summary, found_keywords, notes, doctor_id, file_hash=None) -> Summary:
+    return Summary(
+        patient_id=UUID(str(patient_id)) if patient_id else None,
+        file_name=file_name,
+        raw_text=file_text.strip(),
+        summary=summary.strip(),
+        keywords=found_keywords,
+        notes=notes,
+        doctor_id=doctor_id,
+        content_hash=file_hash
+    )
+
+async def save_summary(patient_id, file_name, file_text, summary, found_keywords, notes, doctor_id, file_hash=None) -> Summary:
+    async with async_session() as session:
+        summary_record = build_summary(patient_id, file_name, file_text, summary, found_keywords, notes, doctor_id, file_hash)
+        metrics.log_event("summary_saved", file_name=file_name, keywords=len(found_keywords))
+        session.add(summary_record)
+        session.add_all(search_index.keyword_rows(summary_record))
+        await session.commit()
+    stats.invalidate(doctor_id)
+    return summary_record
+
+async def save_summaries(records: list[Summary]):
+    async with async_session() as session:
+        session.add_all(records)
+        for record in records:
+            session.add_all(search_index.keyword_rows(record))
+        await session.commit()
+    for doctor_id in {record.doctor_id for record in records}:
+        stats.invalidate(doctor_id)
+
+async def summarize_upload(file_name: str, path: str, file_hash: str, patient_id, notes, doctor_id, use_cache: bool = True, priority: str | None = None) -> Summary:
+    """
+    Extract, summarize and store one spooled upload. A byte-identical document
+    already stored for the patient is returned as is unless use_cache is False.
+    The LLM calls run at `priority` (batch by default). LLM errors propagate to the caller.
+    """
+    if use_cache:
+        duplicates = await find_duplicates(patient_id, doctor_id, [file_hash])
+        if file_hash in duplicates:
+            return duplicates[file_hash]
+
+    file_text = await extraction.extract_file(file_name, path)
+    # Keyword extraction runs in a thread while the LLM summarizes.
+    summary, found_keywords = await asyncio.gather(
+        summarizer.summarize_document(file_text, notes, use_cache=use_cache, doctor_id=doctor_id, priority=priority),
+        asyncio.to_thread(extract_keywords, file_text),
+    )
+    return await save_summary(patient_id, file_name, file_text, summary, found_keywords, notes, doctor_id, file_hash)
+
+async def summarize_batch(files: list[tuple[str, str, str]], patient_id, notes, doctor_id, use_cache: bool = True) -> list[dict]:
+    """
+    Summarize many spooled documents, given as (file_name, path, sha256), for
+    one patient. Extraction runs in parallel in the extraction pool, LLM
+    calls are bounded by BATCH_CONCURRENCY, and every new summary is inserted in
+    a single transaction. Files already stored for the patient, or repeated
+    within the batch, reuse the existing summary. Returns one result per file, in order.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    hashes = [file_hash for _, _, file_hash in files]
+    duplicates = await find_duplicates(patient_id, doctor_id, list(set(hashes))) if use_cache else {}
+    first_seen: dict[str, asyncio.Task] = {}
+
+    async def process(file_name: str, path: str, file_hash: str):
+        try:
+            file_text = await extraction.extract_file(file_name, path)
+        except (ValueError, extraction.ExtractionUnavailable) as e:
+            return {"file_name": file_name, "error": str(e)}, None
+        found_keywords = await asyncio.to_thread(extract_keywords, file_text)
+        try:
+            async with semaphore:
+                summary = await summarizer.summarize_document(file_text, notes, use_cache=use_cache, doctor_id=doctor_id)
+        except Exception as e:
+            metrics.log_event("batch_summary_failed", sampled=False, level=logging.WARNING, file_name=file_name, error=repr(e))
+            return {"file_name": file_name, "error": "Failed to generate summary from AI Agent"}, None
+
+        record = build_summary(patient_id, file_name, file_text, summary, found_keywords, notes, doctor_id, file_hash)
+        return {
+            "file_name": file_name,
+            "summary_id": str(record.id),
+            "summary": record.summary,
+            "keywords": found_keywords,
+        }, record
+
+    async def reuse_stored(file_name: str, existing: Summary):
+        return {
+            "file_name": file_name,
+            "summary_id": str(existing.id),
+            "summary": existing.summary,
+            "keywords": existing.keywords,
+            "duplicate": True,
+        }, None
+
+    async def reuse_in_batch(file_name: str, original: asyncio.Task):
+        result, _ = await original
+        return {**result, "file_name": file_name, "duplicate": True}, None
+
+    tasks = []
+    for file_name, path, file_hash in files:
+        if file_hash in duplicates:
+            tasks.append(reuse_stored(file_name, duplicates[file_hash]))
+        elif file_hash in first_seen and use_cache:
+            tasks.append(reuse_in_batch(file_name, first_seen[file_hash]))
+        else:
+            task = asyncio.ensure_future(process(file_name, path, file_hash))
+            first_seen[file_hash] = task
+            tasks.append(task)
+
+    outcomes = await asyncio.gather(*tasks)
+    records = [record for _, record in outcomes if record is not None]
+    if records:
+        await save_summaries(records)
+    return [result for result, _ in outcomes]
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from uuid import uuid4
+import fitz
+from fastapi import UploadFile
+import metrics
+
+PAGE_BREAK = "\f"
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to one pool task; large PDFs are split across several workers.
+PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "25"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "1000"))
+SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "medagentx-uploads"))
+
+_pool: ProcessPoolExecutor | None = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+class ExtractionUnavailable(Exception):
+    """A pool worker died (a crash or OOM on some document); the pool is rebuilt and the call can be retried."""
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+####### Spooling #######
+
+def _spool_path() -> str:
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    return os.path.join(SPOOL_DIR, uuid4().hex)
+
+def remove(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+async def spool_upload(file: UploadFile) -> tuple[str, str]:
+    """
+    Stream an upload to disk in 1 MiB pieces, enforcing MAX_UPLOAD_BYTES.
+    Returns the spooled path and the SHA-256 of the contents.
+    """
+    path = _spool_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while chunk := await file.read(1024 * 1024):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise ValueError(f"{file.filename} is larger than the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit.")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        remove(path)
+        raise
+    return path, digest.hexdigest()
+
+def _unpack_zip(path: str, max_total_bytes: int) -> list[tuple[str, str, str]]:
+    members = []
+    try:
+        with zipfile.ZipFile(path) as archive:
+            infos = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith((".pdf", ".txt"))
+            ]
+            if sum(info.file_size for info in infos) > max_total_bytes:
+                raise ValueError("Zip archive is too large.")
+            for info in infos:
+                if info.file_size > MAX_UPLOAD_BYTES:
+                    raise ValueError(f"{info.filename} is larger than the upload limit.")
+                member_path = _spool_path()
+                digest = hashlib.sha256()
+                with archive.open(info) as src, open(member_path, "wb") as dst:
+                    while chunk := src.read(1024 * 1024):
+                        digest.update(chunk)
+                        dst.write(chunk)
+                members.append((os.path.basename(info.filename), member_path, digest.hexdigest()))
+    except zipfile.BadZipFile:
+        raise ValueError("Failed to read zip archive.")
+    except BaseException:
+        for _, member_path, _ in members:
+            remove(member_path)
+        raise
+    return members
+
+async def unpack_zip(path: str, max_total_bytes: int) -> list[tuple[str, str, str]]:
+    """Spool the .pdf/.txt members of a zip to disk as (file_name, path, sha256) tuples."""
+    return await asyncio.to_thread(_unpack_zip, path, max_total_bytes)
+
+####### Extraction #######
+
+def _page_count(path: str) -> int:
+    with fitz.open(path, filetype="pdf") as pdf:
+        return pdf.page_count
+
+def _extract_pages(path: str, start: int, stop: int) -> list[str]:
+    with fitz.open(path, filetype="pdf") as pdf:
+        return [pdf[i].get_text() for i in range(start, stop)]
+
+def _unreadable_pdf(file_name: str, path: str, error: Exception) -> ValueError:
+    """The error shown for a PDF PyMuPDF cannot read. Its message names the spooled file, so that is only logged."""
+    metrics.log_event("pdf_unreadable", sampled=False, level=logging.WARNING, file_name=file_name, path=path, error=repr(error))
+    return ValueError(f"Failed to read PDF {file_name}.")
+
+async def iter_pdf_pages(file_name: str, path: str):
+    """
+    Yield the page texts of a PDF in order, a batch at a time. Page ranges are
+    extracted concurrently in the process pool, so the event loop never runs
+    PyMuPDF and a large document uses several cores.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    futures = []
+    try:
+        try:
+            page_count = await loop.run_in_executor(pool, _page_count, path)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            raise _unreadable_pdf(file_name, path, e)
+        if page_count > MAX_PDF_PAGES:
+            raise ValueError(f"PDF has {page_count} pages; the limit is {MAX_PDF_PAGES}.")
+
+        futures = [
+            loop.run_in_executor(pool, _extract_pages, path, start, min(start + PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PAGES_PER_TASK)
+        ]
+        for future in futures:
+            try:
+                pages = await future
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                raise _unreadable_pdf(file_name, path, e)
+            yield pages
+    except BrokenProcessPool:
+        # Submitting to, or waiting on, a pool whose worker died; the next call starts a fresh one.
+        _discard_pool(pool)
+        raise ExtractionUnavailable("PDF extraction is temporarily unavailable; please try again.")
+    finally:
+        for future in futures:
+            future.cancel()
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        contents = f.read()
+    try:
+        return contents.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ValueError("Unsupported file type. Please upload a .txt or .pdf file.")
+
+async def extract_file(file_name: str, path: str) -> str:
+    """
+    Return the text of a spooled .pdf or .txt upload, raising ValueError with a
+    user-facing message for documents that cannot be read, and
+    ExtractionUnavailable when the extraction pool broke underneath the call.
+    """
+    if file_name.lower().endswith(".pdf"):
+        with metrics.extraction_duration.time(kind="pdf"):
+            pages = []
+            async for batch in iter_pdf_pages(file_name, path):
+                pages.extend(batch)
+            return PAGE_BREAK.join(pages)
+    with metrics.extraction_duration.time(kind="txt"):
+        return await asyncio.to_thread(_read_text, path)
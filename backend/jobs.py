@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from sqlalchemy import and_, or_, update
+from sqlmodel import select, func
+from db import async_session
+from models import Job
+import documents
+import extraction
+import metrics
+
+# Backend is "memory" (single process) or "postgres" (job table shared by every worker process).
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAXSIZE = int(os.getenv("JOB_QUEUE_MAXSIZE", "1000"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+# How often a running job renews its lease; must stay well below JOB_LEASE_SECONDS.
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 4)))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+class InMemoryJobBackend:
+    def __init__(self, maxsize: int):
+        self._jobs: dict[UUID, Job] = {}
+        self._queue: asyncio.Queue[UUID] = asyncio.Queue(maxsize)
+        self._pending: set[asyncio.Task] = set()
+
+    def _prune(self):
+        cutoff = _now() - timedelta(seconds=JOB_RESULT_TTL)
+        expired = [job_id for job_id, job in self._jobs.items() if job.status in TERMINAL_STATUSES and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def enqueue(self, job: Job):
+        self._prune()
+        self._queue.put_nowait(job.id)
+        self._jobs[job.id] = job
+
+    async def claim(self) -> Job:
+        while True:
+            job = self._jobs.get(await self._queue.get())
+            if job and job.status == "queued":
+                job.status = "running"
+                job.attempts += 1
+                job.updated_at = _now()
+                return job
+
+    async def retry(self, job: Job, delay: float):
+        job.status = "queued"
+        job.updated_at = _now()
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self._queue.put(job.id)
+
+        task = asyncio.create_task(requeue())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def save(self, job: Job):
+        job.updated_at = _now()
+
+    async def touch(self, job: Job):
+        job.updated_at = _now()
+
+    async def get(self, job_id: UUID) -> Job | None:
+        return self._jobs.get(job_id)
+
+    async def depth(self) -> int:
+        return self._queue.qsize()
+
+class PostgresJobBackend:
+    """
+    Queue stored in the job table. Workers claim rows with FOR UPDATE SKIP LOCKED,
+    so several worker processes can share it; a running job whose worker stopped
+    updating it for JOB_LEASE_SECONDS is picked up again.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+
+    async def enqueue(self, job: Job):
+        if await self.depth() >= self.maxsize:
+            raise asyncio.QueueFull
+        async with async_session() as session:
+            session.add(job)
+            await session.commit()
+
+    async def _claim(self) -> Job | None:
+        now = _now()
+        async with async_session() as session:
+            job = (await session.exec(
+                select(Job)
+                .where(or_(
+                    and_(Job.status == "queued", Job.run_after <= now),
+                    and_(Job.status == "running", Job.updated_at < now - timedelta(seconds=JOB_LEASE_SECONDS)),
+                ))
+                .order_by(Job.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )).first()
+            if not job:
+                return None
+            job.status = "running"
+            job.attempts += 1
+            job.updated_at = now
+            await session.commit()
+            return job
+
+    async def claim(self) -> Job:
+        while True:
+            job = await self._claim()
+            if job:
+                return job
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def retry(self, job: Job, delay: float):
+        job.status = "queued"
+        job.run_after = _now() + timedelta(seconds=delay)
+        await self.save(job)
+
+    async def save(self, job: Job):
+        job.updated_at = _now()
+        async with async_session() as session:
+            await session.merge(job)
+            await session.commit()
+
+    async def touch(self, job: Job):
+        """Renew the lease of a running job so no other worker reclaims it."""
+        job.updated_at = _now()
+        async with async_session() as session:
+            await session.exec(update(Job).where(Job.id == job.id).values(updated_at=job.updated_at))
+            await session.commit()
+
+    async def get(self, job_id: UUID) -> Job | None:
+        async with async_session() as session:
+            return await session.get(Job, job_id)
+
+    async def depth(self) -> int:
+        async with async_session() as session:
+            return (await session.exec(select(func.count()).select_from(Job).where(Job.status == "queued"))).one()
+
+####### Handlers #######
+
+async def _run_summarize(job: Job) -> dict:
+    payload = job.payload
+    summary = await documents.summarize_upload(
+        payload["file_name"], payload["path"], payload["file_hash"], payload["patient_id"], payload["notes"], job.doctor_id,
+        use_cache=payload.get("use_cache", True),
+    )
+    return {"summary_id": str(summary.id)}
+
+HANDLERS = {
+    "summarize": _run_summarize,
+}
+
+####### Queue #######
+
+class JobQueue:
+    def __init__(self, backend, workers: int = JOB_WORKERS):
+        self.backend = backend
+        self.workers = workers
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, doctor_id: UUID, payload: dict) -> Job:
+        job = Job(kind=kind, doctor_id=doctor_id, payload=payload, max_attempts=JOB_MAX_RETRIES + 1)
+        await self.backend.enqueue(job)
+        return job
+
+    async def get(self, job_id: UUID) -> Job | None:
+        return await self.backend.get(job_id)
+
+    async def _run(self, job: Job) -> dict:
+        """Run the job's handler, renewing its lease every JOB_HEARTBEAT_SECONDS until it returns."""
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+                try:
+                    await self.backend.touch(job)
+                except Exception as e:
+                    metrics.log_event("job_heartbeat_failed", sampled=False, level=logging.WARNING, job_id=str(job.id), error=repr(e))
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            return await HANDLERS[job.kind](job)
+        finally:
+            beat.cancel()
+
+    async def _worker(self):
+        while True:
+            try:
+                await self._process(await self.backend.claim())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The backend itself failed (a dropped connection, a pool
+                # timeout). An unsaved job is picked up again once its lease expires.
+                metrics.log_event("job_worker_error", sampled=False, level=logging.ERROR, error=repr(e))
+                await asyncio.sleep(JOB_RETRY_DELAY)
+
+    async def _process(self, job: Job):
+        try:
+            job.result = await self._run(job)
+            job.status = "succeeded"
+            job.error = None
+        except ValueError as e:
+            # Unreadable or unsupported documents will not get better on retry.
+            job.status = "failed"
+            job.error = str(e)
+        except Exception as e:
+            metrics.log_event(
+                "job_attempt_failed", sampled=False, level=logging.WARNING,
+                job_id=str(job.id), kind=job.kind, attempt=job.attempts, error=repr(e),
+            )
+            job.error = str(e)
+            if job.attempts < job.max_attempts:
+                await self.backend.retry(job, JOB_RETRY_DELAY * job.attempts)
+                return
+            job.status = "failed"
+
+        await self.backend.save(job)
+        extraction.remove((job.payload or {}).get("path"))
+
+def job_status(job: Job) -> dict:
+    return {
+        "job_id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "summary_id": (job.result or {}).get("summary_id"),
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+queue = JobQueue(PostgresJobBackend(JOB_QUEUE_MAXSIZE) if JOB_BACKEND == "postgres" else InMemoryJobBackend(JOB_QUEUE_MAXSIZE))
@@ -0,0 +1,86 @@
+import os
+import re
+from collections import defaultdict
+
+KEYWORDS_FILE = os.getenv("KEYWORDS_FILE", os.path.join(os.path.dirname(__file__), "keywords.txt"))
+
+def load_vocabulary(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+def _trie_pattern(node: dict) -> str:
+    terminal = "" in node
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch != ""]
+    if not branches:
+        return ""
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+    group = "(?:" + "|".join(branches) + ")"
+    return group + "?" if terminal else group
+
+class KeywordExtractor:
+    """
+    Finds vocabulary terms in a document with one pass of a single compiled regex.
+
+    The vocabulary is folded into a trie and emitted as one pattern, so each text
+    position costs at most the length of the longest term rather than one scan per
+    term. Matching keeps the `\\b<term>\\b`, case-insensitive semantics of the old
+    per-keyword loop, including terms that overlap (e.g. "chest pain" and "pain").
+    """
+
+    def __init__(self, terms: list[str]):
+        self.terms: list[str] = []
+        seen = set()
+        for term in terms:
+            key = term.lower()
+            if key not in seen:
+                seen.add(key)
+                self.terms.append(term)
+        self._order = {term.lower(): i for i, term in enumerate(self.terms)}
+
+        trie: dict = {}
+        for key in self._order:
+            node = trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[""] = True
+
+        # The regex reports the longest term at each position; shorter terms that
+        # are word-bounded prefixes of it start at the same offset and are implied.
+        self._prefixes: dict[str, list[str]] = {}
+        for key in self._order:
+            self._prefixes[key] = [
+                key[:i] for i in range(1, len(key))
+                if _is_word_char(key[i - 1]) != _is_word_char(key[i]) and key[:i] in self._order
+            ]
+
+        self._pattern = re.compile(r"\b(?=(" + _trie_pattern(trie) + r")\b)", re.IGNORECASE) if trie else None
+
+    @classmethod
+    def from_file(cls, path: str = KEYWORDS_FILE) -> "KeywordExtractor":
+        return cls(load_vocabulary(path))
+
+    def matches(self, text: str) -> dict[str, dict]:
+        """Return {term: {"count": n, "offsets": [(start, end), ...]}} in vocabulary order."""
+        found = defaultdict(list)
+        if self._pattern is None or not text:
+            return {}
+        for m in self._pattern.finditer(text):
+            start, end = m.span(1)
+            key = m.group(1).lower()
+            found[key].append((start, end))
+            for prefix in self._prefixes[key]:
+                found[prefix].append((start, start + len(prefix)))
+
+        return {
+            self.terms[self._order[key]]: {"count": len(offsets), "offsets": sorted(offsets)}
+            for key, offsets in sorted(found.items(), key=lambda item: self._order[item[0]])
+        }
+
+    def extract(self, text: str) -> list[str]:
+        return [term.capitalize() for term in self.matches(text)]
+
+extractor = KeywordExtractor.from_file()
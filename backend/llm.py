@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+import llm_cache
+import metrics
+import scheduler
+
+load_dotenv()
+
+# Retries after the first attempt, and the backoff they are drawn from
+# (full jitter: uniform between 0 and base * 2**retry, capped).
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "8"))
+# Consecutive failures that open a model's circuit, and seconds it stays open
+# before a single probe request is let through.
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+def _profile(stage: str, model: str, temperature: float, max_tokens: int, deadline: float, attempt_timeout: float, priority: str, hedge_after: float = 0) -> dict:
+    """
+    Settings of one stage; each can be overridden with LLM_<STAGE>_<SETTING>.
+    deadline bounds the whole call including retries, attempt_timeout a single
+    request (for streams, the wait for each chunk). When hedge_after is set, a
+    second request is sent if the first has not answered by then. priority is
+    the scheduler class of the stage's calls.
+    """
+    prefix = f"LLM_{stage.upper()}_"
+    return {
+        "model": os.getenv(prefix + "MODEL", model),
+        "temperature": float(os.getenv(prefix + "TEMPERATURE", str(temperature))),
+        "max_tokens": int(os.getenv(prefix + "MAX_TOKENS", str(max_tokens))),
+        "deadline": float(os.getenv(prefix + "DEADLINE", str(deadline))),
+        "attempt_timeout": float(os.getenv(prefix + "ATTEMPT_TIMEOUT", str(attempt_timeout))),
+        "hedge_after": float(os.getenv(prefix + "HEDGE_AFTER", str(hedge_after))),
+        "priority": os.getenv(prefix + "PRIORITY", priority),
+    }
+
+PROFILES = {
+    "summary": _profile("summary", "gpt-3.5-turbo", 0.4, 1000, deadline=120, attempt_timeout=60, priority=scheduler.BATCH),
+    "diagnosis": _profile("diagnosis", "gpt-3.5-turbo", 0.3, 1000, deadline=60, attempt_timeout=30, priority=scheduler.INTERACTIVE),
+    "recommendation": _profile("recommendation", "gpt-3.5-turbo", 0.3, 500, deadline=45, attempt_timeout=20, priority=scheduler.INTERACTIVE),
+}
+
+# Retries are done here, with the stage's deadline, rather than by the SDK.
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+class LLMError(Exception):
+    """The provider rejected the request (bad request, auth); callers answer 502."""
+
+class LLMUnavailable(LLMError):
+    """The completion could not be produced in time, the circuit is open or the scheduler is saturated; callers answer 503."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+####### Circuit breaker #######
+
+# Per model: consecutive failures, when the circuit may be probed again, and whether a probe is running.
+_breakers: dict[str, dict] = {}
+
+def _breaker(model: str) -> dict:
+    return _breakers.setdefault(model, {"failures": 0, "open_until": 0.0, "probing": False})
+
+def _admit(model: str):
+    """Raise LLMUnavailable while the model's circuit is open; once it cools down, let one probe through."""
+    breaker = _breaker(model)
+    if breaker["failures"] < LLM_BREAKER_FAILURES:
+        return
+    remaining = breaker["open_until"] - time.monotonic()
+    if remaining > 0 or breaker["probing"]:
+        metrics.llm_breaker_rejections.inc(model=model)
+        raise LLMUnavailable("The AI service is temporarily unavailable.", retry_after=max(remaining, 1))
+    breaker["probing"] = True
+
+def _succeeded(model: str):
+    breaker = _breaker(model)
+    if breaker["failures"] >= LLM_BREAKER_FAILURES:
+        metrics.log_event("llm_circuit_closed", sampled=False, model=model)
+    breaker.update(failures=0, probing=False)
+
+def _failed(model: str):
+    breaker = _breaker(model)
+    breaker["failures"] += 1
+    breaker["probing"] = False
+    if breaker["failures"] >= LLM_BREAKER_FAILURES:
+        breaker["open_until"] = time.monotonic() + LLM_BREAKER_COOLDOWN
+        metrics.llm_breaker_opened.inc(model=model)
+        metrics.log_event("llm_circuit_open", sampled=False, level=logging.WARNING, model=model, failures=breaker["failures"])
+
+def available(stage: str) -> float | None:
+    """None when the stage's model accepts requests, otherwise seconds until it may again."""
+    breaker = _breaker(PROFILES[stage]["model"])
+    if breaker["failures"] < LLM_BREAKER_FAILURES:
+        return None
+    remaining = breaker["open_until"] - time.monotonic()
+    return max(remaining, 1) if remaining > 0 or breaker["probing"] else None
+
+####### Calls #######
+
+def _record_call(stage: str, model: str, messages: list[dict], started: float, usage):
+    latency = time.perf_counter() - started
+    metrics.llm_request_duration.observe(latency, stage=stage, model=model)
+    fields = {}
+    if usage is not None:
+        metrics.llm_tokens.inc(usage.prompt_tokens, stage=stage, model=model, kind="prompt")
+        metrics.llm_tokens.inc(usage.completion_tokens, stage=stage, model=model, kind="completion")
+        fields = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+    metrics.log_event("llm_call", stage=stage, model=model, latency=round(latency, 3), **fields, **metrics.prompt_fields(messages))
+
+def _record_error(stage: str, model: str, error: Exception):
+    metrics.llm_errors.inc(stage=stage, error=type(error).__name__)
+    metrics.log_event("llm_error", sampled=False, level=logging.WARNING, stage=stage, model=model, error=repr(error))
+
+def _settings(stage: str, model: str | None, temperature: float | None, max_tokens: int | None) -> tuple[dict, str, float, int]:
+    profile = PROFILES[stage]
+    return (
+        profile,
+        model or profile["model"],
+        profile["temperature"] if temperature is None else temperature,
+        max_tokens or profile["max_tokens"],
+    )
+
+def _backoff(retry: int, error: Exception) -> float:
+    delay = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** retry))
+    # Rate limits say when to come back; wait at least that long.
+    retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        return delay
+
+async def _with_retries(stage: str, model: str, profile: dict, attempt):
+    """
+    Run attempt(timeout) until it succeeds, retrying retryable errors with
+    jittered backoff while the stage's deadline allows. Every outcome feeds the
+    model's circuit breaker; exhausted retries and the deadline raise LLMUnavailable.
+    """
+    deadline = time.monotonic() + profile["deadline"]
+    for retry in range(LLM_RETRIES + 1):
+        _admit(model)
+        remaining = deadline - time.monotonic()
+        try:
+            result = await attempt(min(profile["attempt_timeout"], remaining))
+        except _RETRYABLE as e:
+            _record_error(stage, model, e)
+            _failed(model)
+            delay = _backoff(retry, e)
+            if retry == LLM_RETRIES or time.monotonic() + delay >= deadline:
+                raise LLMUnavailable("The AI service did not respond in time.") from e
+            metrics.llm_retries.inc(stage=stage, error=type(e).__name__)
+            await asyncio.sleep(delay)
+            continue
+        except scheduler.QueueTimeout as e:
+            _breaker(model)["probing"] = False
+            raise LLMUnavailable("The AI service is busy; try again shortly.", retry_after=e.retry_after) from e
+        except openai.APIError as e:
+            # Bad requests and auth errors will not improve on retry; they do
+            # not say the upstream is degraded either, so the breaker ignores them.
+            _record_error(stage, model, e)
+            _breaker(model)["probing"] = False
+            raise LLMError("The AI service rejected the request.") from e
+        except BaseException:
+            _breaker(model)["probing"] = False
+            raise
+        _succeeded(model)
+        return result
+
+def _usage_tokens(usage) -> int | None:
+    return usage.prompt_tokens + usage.completion_tokens if usage is not None else None
+
+async def _create(stage: str, messages: list[dict], model: str, temperature: float, max_tokens: int, timeout: float, doctor_id, priority: str):
+    async with scheduler.scheduler.slot(doctor_id, priority, scheduler.request_tokens(messages, max_tokens)) as usage:
+        started = time.perf_counter()
+        response = await asyncio.wait_for(
+            client.chat.completions.create(model=model, temperature=temperature, max_tokens=max_tokens, messages=messages),
+            timeout,
+        )
+        usage["tokens"] = _usage_tokens(response.usage) or usage["tokens"]
+    _record_call(stage, model, messages, started, response.usage)
+    return response
+
+async def _hedged(stage: str, profile: dict, request, timeout: float):
+    """
+    Send the request; if it has not answered after hedge_after seconds, send a
+    second copy and return whichever finishes first successfully.
+    """
+    if not profile["hedge_after"] or profile["hedge_after"] >= timeout:
+        return await request(timeout)
+
+    first = asyncio.create_task(request(timeout))
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=profile["hedge_after"])
+        if done:
+            return first.result()
+
+        metrics.llm_hedges.inc(stage=stage)
+        pending.add(asyncio.create_task(request(timeout - profile["hedge_after"])))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Both failed: surface the first request's error.
+        return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def chat_completion(
+    messages: list[dict],
+    stage: str,
+    use_cache: bool = True,
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    doctor_id=None,
+    priority: str | None = None,
+) -> str:
+    """
+    Return the completion for `messages` using the stage's profile (summary,
+    diagnosis, recommendation); model, temperature, max_tokens and priority
+    override it. The call waits in doctor_id's scheduler flow for its turn.
+    Identical requests are answered from llm_cache; use_cache=False skips the
+    lookup but still stores the fresh result. Raises LLMUnavailable when no
+    answer arrives within the stage's deadline or its circuit is open.
+    """
+    profile, model, temperature, max_tokens = _settings(stage, model, temperature, max_tokens)
+    key = llm_cache.make_key(model, temperature, max_tokens, messages)
+    if use_cache:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            metrics.llm_cache_hits.inc(stage=stage)
+            return cached
+
+    async def request(timeout: float):
+        return await _create(stage, messages, model, temperature, max_tokens, timeout, doctor_id, priority or profile["priority"])
+
+    response = await _with_retries(stage, model, profile, lambda timeout: _hedged(stage, profile, request, timeout))
+    content = response.choices[0].message.content
+    if content:
+        await llm_cache.put(key, model, content)
+    return content
+
+async def stream_chat_completion(
+    messages: list[dict],
+    stage: str,
+    use_cache: bool = True,
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    doctor_id=None,
+    priority: str | None = None,
+):
+    """
+    Yield content deltas as they arrive. The scheduler slot is held until the
+    stream ends. A cached completion is yielded as a single delta. Opening the
+    stream is retried like chat_completion; once the first delta has been
+    yielded a failure raises LLMUnavailable instead, since the caller already
+    has part of the answer. Each chunk must arrive within attempt_timeout.
+    """
+    profile, model, temperature, max_tokens = _settings(stage, model, temperature, max_tokens)
+    key = llm_cache.make_key(model, temperature, max_tokens, messages)
+    if use_cache:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            metrics.llm_cache_hits.inc(stage=stage)
+            yield cached
+            return
+
+    parts = []
+    usage = None
+    try:
+        async with scheduler.scheduler.slot(doctor_id, priority or profile["priority"], scheduler.request_tokens(messages, max_tokens)) as used:
+            started = time.perf_counter()
+
+            async def open_stream(timeout: float):
+                stream = await asyncio.wait_for(client.chat.completions.create(
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ), timeout)
+                chunks = stream.__aiter__()
+                try:
+                    first = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except BaseException:
+                    await stream.close()
+                    raise
+                return stream, chunks, first
+
+            stream, chunks, chunk = await _with_retries(stage, model, profile, open_stream)
+            deadline = time.monotonic() + profile["deadline"]
+            try:
+                while True:
+                    # The last chunk carries the token usage and no choices.
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), min(profile["attempt_timeout"], max(deadline - time.monotonic(), 0)))
+                    except StopAsyncIteration:
+                        break
+                    except (*_RETRYABLE, openai.APIError) as e:
+                        _record_error(stage, model, e)
+                        _failed(model)
+                        raise LLMUnavailable("The AI service stopped responding.") from e
+            finally:
+                await stream.close()
+                used["tokens"] = _usage_tokens(usage) or used["tokens"]
+    except scheduler.QueueTimeout as e:
+        raise LLMUnavailable("The AI service is busy; try again shortly.", retry_after=e.retry_after) from e
+    _record_call(stage, model, messages, started, usage)
+    if parts:
+        await llm_cache.put(key, model, "".join(parts))
+
+async def close():
+    await client.close()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from db import async_session
+from models import LLMCacheEntry
+import metrics
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "true").lower() == "true"
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "100000"))
+# Expired and overflow rows are purged after every this many stores.
+LLM_CACHE_PURGE_EVERY = int(os.getenv("LLM_CACHE_PURGE_EVERY", "500"))
+
+_memory: OrderedDict[str, tuple[datetime, str]] = OrderedDict()
+stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def make_key(model: str, temperature: float, max_tokens: int, messages: list[dict]) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "max_tokens": max_tokens, "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _remember(key: str, created_at: datetime, response: str):
+    _memory[key] = (created_at, response)
+    _memory.move_to_end(key)
+    while len(_memory) > LLM_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+async def _db_get(key: str) -> LLMCacheEntry | None:
+    async with async_session() as session:
+        entry = await session.get(LLMCacheEntry, key)
+        if not entry or entry.created_at < _now() - timedelta(seconds=LLM_CACHE_TTL):
+            return None
+        entry.last_used_at = _now()
+        await session.commit()
+        return entry
+
+async def _db_set(key: str, model: str, response: str, created_at: datetime):
+    async with async_session() as session:
+        await session.exec(
+            insert(LLMCacheEntry)
+            .values(key=key, model=model, response=response, created_at=created_at, last_used_at=created_at)
+            .on_conflict_do_update(
+                index_elements=["key"],
+                set_={"response": response, "created_at": created_at, "last_used_at": created_at},
+            )
+        )
+        await session.commit()
+
+async def _db_purge():
+    async with async_session() as session:
+        await session.exec(delete(LLMCacheEntry).where(LLMCacheEntry.created_at < _now() - timedelta(seconds=LLM_CACHE_TTL)))
+        overflow = (
+            select(LLMCacheEntry.key)
+            .order_by(LLMCacheEntry.last_used_at.desc())
+            .offset(LLM_CACHE_MAX_ROWS)
+        )
+        await session.exec(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(overflow)))
+        await session.commit()
+
+async def get(key: str) -> str | None:
+    """Look a completion up in memory, then in the llmcacheentry table."""
+    cached = _memory.get(key)
+    if cached and cached[0] >= _now() - timedelta(seconds=LLM_CACHE_TTL):
+        _memory.move_to_end(key)
+        stats["memory_hits"] += 1
+        return cached[1]
+
+    if LLM_CACHE_PERSIST:
+        try:
+            entry = await _db_get(key)
+        except Exception as e:
+            metrics.log_event("llm_cache_error", sampled=False, level=logging.WARNING, operation="lookup", error=repr(e))
+            stats["errors"] += 1
+            entry = None
+        if entry:
+            _remember(key, entry.created_at, entry.response)
+            stats["db_hits"] += 1
+            return entry.response
+
+    stats["misses"] += 1
+    return None
+
+async def put(key: str, model: str, response: str):
+    created_at = _now()
+    _remember(key, created_at, response)
+    stats["stores"] += 1
+    if not LLM_CACHE_PERSIST:
+        return
+    try:
+        await _db_set(key, model, response, created_at)
+        if stats["stores"] % LLM_CACHE_PURGE_EVERY == 0:
+            await _db_purge()
+    except Exception as e:
+        metrics.log_event("llm_cache_error", sampled=False, level=logging.WARNING, operation="store", error=repr(e))
+        stats["errors"] += 1
+
+def snapshot() -> dict:
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    hits = stats["memory_hits"] + stats["db_hits"]
+    return {
+        **stats,
+        "memory_entries": len(_memory),
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+    }
@@ -1,38 +1,58 @@
-import re
-import fitz
+import asyncio
 import os
+import json
 import io
+import math
 from datetime import datetime, timezone, timedelta
-from io import BytesIO
-from fpdf import FPDF
-from sqlalchemy.orm import Session
-from fastapi import Body, Depends, FastAPI, File, UploadFile, Form, HTTPException, Query, Response, Header
+from sqlalchemy.orm import defer
+from fastapi import Body, Depends, FastAPI, File, UploadFile, Form, HTTPException, Query, Request, Response, Header
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
-from openai import OpenAI
+from typing import Callable, List, Optional
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
-from db import init_db, engine
-from models import Summary, Feedback, Diagnosis, DiagnosisHistory, RecommendationHistory, Patient, Doctor, DoctorUpdate #MODELS
-from sqlmodel import Session, select, delete
+from db import init_db, engine, async_session, get_session
+from models import Summary, Feedback, Diagnosis, DiagnosisHistory, RecommendationHistory, Patient, Doctor, DoctorUpdate, SummaryListItem, SummaryPage, SearchPage, RecentSummary, PatientOption #MODELS
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from uuid import UUID, uuid4
 from pydantic import BaseModel
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from textwrap import wrap
-from fastapi.responses import StreamingResponse
-from sqlalchemy import cast, func, text, String
-from sqlalchemy.dialects.postgresql import JSONB
-from auth_utils import create_access_token, get_current_doctor
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from auth_utils import create_doctor_token, get_current_doctor
+import auth_utils
+import llm
+import llm_cache
+import summarizer
+import documents
+import extraction
+import stats
+import jobs
+import scheduler
+import search_index
+import pagination
+import patients
+import cases
+import reports
+import metrics
+
+try:
+    import orjson
+except ImportError:  # optional; responses fall back to the stdlib encoder
+    orjson = None
 
 ####### Models #######
 
 class DiagnosisRequest(BaseModel):
-    summary: str
     summary_id: str
+    # Read from the stored summary when omitted.
+    summary: Optional[str] = None
 
 class FeedbackRequest(BaseModel):
     summary_id : str
@@ -41,8 +61,12 @@ class FeedbackRequest(BaseModel):
 
 class RecommendationRequest(BaseModel):
     summary_id: str
-    summary: str
-    diagnosis: str
+    # Read from the stored summary and current diagnosis when omitted.
+    summary: Optional[str] = None
+    diagnosis: Optional[str] = None
+
+class PatientBulkDeleteRequest(BaseModel):
+    patient_ids: List[UUID]
 
 class DoctorRegisterRequest(BaseModel):
     username: str
@@ -57,10 +81,17 @@ class DoctorLoginRequest(BaseModel):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    metrics.start()
+    await init_db()
+    await jobs.queue.start()
     yield
+    await jobs.queue.stop()
+    extraction.shutdown()
+    await llm.close()
+    await engine.dispose()
+    metrics.shutdown()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse if orjson else JSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -68,10 +99,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 def verify_token(token: str = Header(...)):
     if not token.startswith("fake-token-for-"):
@@ -84,135 +125,347 @@ def read_root():
 
 ####### Summary API #######
 
-@app.post("/generate-summary")
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """
+    Calls on_close however the response ends, even when sending fails before
+    the body starts. A background task would be skipped then, and a generator
+    that never starts never reaches its finally.
+    """
+
+    def __init__(self, *args, on_close: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+def sse_response(events, on_close: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    if on_close:
+        return _ClosingStreamingResponse(events, media_type="text/event-stream", headers=headers, on_close=on_close)
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
+
+@app.exception_handler(llm.LLMError)
+async def llm_error_handler(request: Request, exc: llm.LLMError):
+    if isinstance(exc, llm.LLMUnavailable):
+        headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+        return JSONResponse({"detail": str(exc)}, status_code=503, headers=headers)
+    return JSONResponse({"detail": str(exc)}, status_code=502)
+
+@app.exception_handler(extraction.ExtractionUnavailable)
+async def extraction_unavailable_handler(request: Request, exc: extraction.ExtractionUnavailable):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+def _require_llm(*stages: str):
+    """Refuse with 503 up front, before a stream starts, when a stage's circuit is open."""
+    for stage in stages:
+        retry_after = llm.available(stage)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=503,
+                detail="The AI service is temporarily unavailable.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+def _check_patient_id(patient_id: Optional[str]):
+    """Refuse a malformed patient_id form field with 400 before the upload is spooled."""
+    if patient_id:
+        try:
+            UUID(patient_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid patient ID")
+
+def json_response(content) -> Response:
+    """
+    Response for list payloads built from plain rows. orjson encodes UUIDs and
+    datetimes itself, so the per-item jsonable_encoder walk is skipped.
+    """
+    if orjson is not None:
+        return ORJSONResponse(content)
+    return JSONResponse(jsonable_encoder(content))
+
+# Columns selected for list views, so raw_text is never read for them.
+SUMMARY_LIST_COLUMNS = [getattr(Summary, name) for name in SummaryListItem.model_fields]
+RECENT_SUMMARY_COLUMNS = [getattr(Summary, name) for name in RecentSummary.model_fields]
+
+@app.post("/generate-summary", status_code=202)
 async def generate_summary(
+    response: Response,
     file: UploadFile = File(...),
     patient_id: Optional[str] = Form(...),
     notes: Optional[str] = Form(None),
+    no_cache: bool = Query(False),
     doctor: Doctor = Depends(get_current_doctor)
 ):
-    contents = await file.read()
-    file_text = ""
-
-    if file.filename.endswith(".pdf"):
-        try:
-            pdf = fitz.open(stream=contents, filetype="pdf")
-            for page in pdf:
-                file_text += page.get_text()
-        except Exception as e:
-            return {"error": f"Failed to read PDF: {str(e)}"}
-    else:
-        try:
-            file_text = contents.decode("utf-8")
-        except UnicodeDecodeError:
-            return {"error": "Unsupported file type. Please upload a .txt or .pdf file."}
-
-    prompt_text = f"""
-You are a medical assistant that reads raw patient documents and optional notes from the uploader, and produces a concise clinical summary.
-
-{f"Uploader's notes: {notes}" if notes else ""}
-Patient Notes:
-{file_text[:2000]}
+    _check_patient_id(patient_id)
+    try:
+        path, file_hash = await extraction.spool_upload(file)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-Return only the summary. Do not include introductions or explanations.
-"""
+    # Once submitted, the spooled file belongs to the job.
+    submitted = False
+    try:
+        if not no_cache:
+            duplicates = await documents.find_duplicates(patient_id, doctor.id, [file_hash])
+            if file_hash in duplicates:
+                response.status_code = 200
+                return {"job_id": None, "status": "succeeded", "summary_id": str(duplicates[file_hash].id), "duplicate": True}
+
+        job = await jobs.queue.submit("summarize", doctor.id, {
+            "path": path,
+            "file_hash": file_hash,
+            "file_name": file.filename,
+            "patient_id": patient_id,
+            "notes": notes,
+            "use_cache": not no_cache,
+        })
+        submitted = True
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many documents are waiting to be processed. Please retry shortly.")
+    finally:
+        if not submitted:
+            extraction.remove(path)
 
-    print("🧠 Prompt sent to GPT:\n", prompt_text)
+    return jobs.job_status(job)
 
+@app.post("/generate-summary/stream")
+async def generate_summary_stream(
+    file: UploadFile = File(...),
+    patient_id: Optional[str] = Form(...),
+    notes: Optional[str] = Form(None),
+    no_cache: bool = Query(False),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    _check_patient_id(patient_id)
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            temperature=0.4,
-            max_tokens=1000,
-            messages=[
-                {"role": "system", "content": "You are a helpful medical AI assistant that summarizes patient records concisely and professionally."},
-                {"role": "user", "content": prompt_text}
-            ]
-        )
-        summary = response.choices[0].message.content
-    except Exception as e:
-        print("OpenAI API error:", e)
-        summary = "Error: Failed to generate summary from AI Agent"
-
-    keywords_list = ["diabetes", "hypertension", "chest pain", "shortness of breath", "headache", "fever", "cough", "nausea", "vomiting", "diarrhea", "fatigue", "weakness", "dizziness", "palpitations", "edema", "rash", "pain", "infection", "anemia", "depression", "anxiety", "insomnia", "sleep", "apnea", "seizure", "stroke", "heart attack", "heart failure", "kidney failure", "liver failure", "cancer", "pneumonia", "asthma", "COPD", "thyroid", "arthritis", "osteoporosis", "fracture", "injury", "surgery", "medication", "allergy", "smoking", "alcohol", "drug", "pregnancy", "contraception", "menstrual", "sexual", "STD", "HIV", "hepatitis", "COVID", "vaccine", "travel", "work", "exercise", "diet", "weight", "cholesterol", "blood pressure", "blood sugar", "heart rate", "respiratory rate", "temperature", "oxygen", "ECG", "EKG", "X-ray", "CT", "MRI", "ultrasound", "biopsy", "blood test", "urine test", "stool test", "sputum test", "swab test", "culture", "genetic", "screening", "diagnosis", "treatment", "medication", "surgery", "procedure", "therapy", "rehabilitation", "counseling", "support", "referral", "follow-up", "emergency", "hospital", "clinic", "office", "home", "telemedicine", "insurance", "payment", "privacy", "consent", "advance directive", "living will", "power of attorney", "healthcare", "provider", "nurse", "assistant", "technician", "therapist", "pharmacist", "social worker", "counselor", "psychologist", "psychiatrist", "surgeon", "specialist", "primary care", "urgent care", "emergency care", "hospital care", "home care", "palliative care", "hospice", "rehabilitation"]
-    found_keywords = [
-        kw.capitalize()
-        for kw in keywords_list
-        if re.search(rf"\b{re.escape(kw)}\b", file_text, re.IGNORECASE)
-    ]
-    if not found_keywords:
-        found_keywords = ["No key medical terms found."]
+        path, file_hash = await extraction.spool_upload(file)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
     try:
-        with Session(engine) as session:
-            summary_record = Summary(
-                patient_id=patient_id,
-                file_name=file.filename,
-                raw_text=file_text.strip(),
-                summary=summary.strip(),
-                keywords=found_keywords,
-                notes=notes,
-                doctor_id=doctor.id
-            )
-            print("📥 Saving summary to DB:", file.filename, found_keywords)
-            session.add(summary_record)
-            session.commit()
-            session.refresh(summary_record)
-    except Exception as e:
-        print("Failed to save summary to DB:", e)
+        if not no_cache:
+            duplicates = await documents.find_duplicates(patient_id, doctor.id, [file_hash])
+            if file_hash in duplicates:
+                existing = duplicates[file_hash]
+
+                async def existing_events():
+                    yield sse_event({"keywords": existing.keywords}, event="keywords")
+                    yield sse_event({"summary_id": str(existing.id), "summary": existing.summary, "keywords": existing.keywords, "duplicate": True}, event="done")
+
+                return sse_response(existing_events())
+
+        _require_llm("summary")
+        file_text = await extraction.extract_file(file.filename, path)
+    except ValueError as e:
+        return {"error": str(e)}
+    finally:
+        extraction.remove(path)
+    file_name = file.filename
+    found_keywords = await asyncio.to_thread(documents.extract_keywords, file_text)
+
+    async def events():
+        yield sse_event({"keywords": found_keywords}, event="keywords")
+        parts = []
+        try:
+            async for delta in summarizer.stream_document_summary(
+                file_text, notes, use_cache=not no_cache, doctor_id=doctor.id, priority=scheduler.INTERACTIVE
+            ):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+        except llm.LLMError as e:
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+
+        # Only reached when the whole completion arrived; a client disconnect
+        # cancels the generator before anything is written.
+        summary = "".join(parts).strip()
+        summary_record = await documents.save_summary(patient_id, file_name, file_text, summary, found_keywords, notes, doctor.id, file_hash)
+        yield sse_event({"summary_id": str(summary_record.id), "summary": summary, "keywords": found_keywords}, event="done")
+
+    return sse_response(events())
+
+@app.post("/generate-summary/batch")
+async def generate_summary_batch(
+    files: List[UploadFile] = File(...),
+    patient_id: Optional[str] = Form(...),
+    notes: Optional[str] = Form(None),
+    no_cache: bool = Query(False),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    _check_patient_id(patient_id)
+    uploads = []
+    try:
+        for file in files:
+            try:
+                path, file_hash = await extraction.spool_upload(file)
+            except ValueError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+
+            if file.filename.lower().endswith(".zip"):
+                try:
+                    uploads.extend(await extraction.unpack_zip(path, documents.MAX_ZIP_UNCOMPRESSED_BYTES))
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                finally:
+                    extraction.remove(path)
+            else:
+                uploads.append((file.filename, path, file_hash))
+
+            if len(uploads) > documents.MAX_BATCH_FILES:
+                raise HTTPException(status_code=413, detail=f"A batch may contain at most {documents.MAX_BATCH_FILES} files.")
+
+        results = await documents.summarize_batch(uploads, patient_id, notes, doctor.id, use_cache=not no_cache)
+    finally:
+        for _, path, _ in uploads:
+            extraction.remove(path)
 
     return {
-        "summary": summary.strip(),
-        "keywords": found_keywords,
+        "total": len(results),
+        "succeeded": sum(1 for r in results if "summary_id" in r),
+        "results": results,
     }
 
-@app.get("/summaries")
-def get_summaries(
+####### Jobs API #######
+
+async def _get_job(job_id: UUID, doctor: Doctor):
+    job = await jobs.queue.get(job_id)
+    if not job or job.doctor_id != doctor.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: UUID, doctor: Doctor = Depends(get_current_doctor)):
+    return jobs.job_status(await _get_job(job_id, doctor))
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: UUID, doctor: Doctor = Depends(get_current_doctor)):
+    job = await _get_job(job_id, doctor)
+
+    async def events():
+        last = None
+        current = job
+        while True:
+            status = jobs.job_status(current)
+            if status != last:
+                yield sse_event(status, event=status["status"])
+                last = status
+            if current.status in jobs.TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(jobs.JOB_POLL_INTERVAL)
+            current = await jobs.queue.get(job_id) or current
+
+    return sse_response(events())
+
+async def _paginate(session: AsyncSession, query, model, limit: int, cursor: Optional[str]) -> tuple[list, Optional[str]]:
+    try:
+        return await pagination.paginate(session, query, model, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _paginate_list(session: AsyncSession, query, model, limit: int, cursor: Optional[str], response: Response) -> list:
+    """Page of a plain-list endpoint; the next cursor goes in X-Next-Cursor so the body keeps its shape."""
+    rows, next_cursor = await _paginate(session, query, model, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@app.get("/summaries", response_model=SummaryPage)
+async def get_summaries(
     file_name: Optional[str] = Query(None),
     patient_id: Optional[str] = Query(None),
     keyword: Optional[str] = Query(None),
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None),
     per_page: int = Query(10, ge=1, le=100),
+    include_total: bool = Query(True),
+    session: AsyncSession = Depends(get_session),
     doctor: Doctor = Depends(get_current_doctor)
 ):
-    with Session(engine) as session:
-        query = select(Summary)
-
-        if file_name:
-            query = query.where(func.lower(Summary.file_name).ilike(f"%{file_name.lower()}%"))
-
-        if patient_id:
-            query = query.where(cast(Summary.patient_id, String).ilike(f"%{patient_id.lower()}%"))
-
-        if keyword:
-            query = query.where(
-                text("""
-                    EXISTS (
-                        SELECT 1 FROM jsonb_array_elements_text(summary.keywords) AS kw
-                        WHERE LOWER(kw) LIKE :kw
-                    )
-                """)
-    ).params(kw=f"%{keyword.lower()}%")
-
-        query = query.order_by(Summary.created_at.desc())
-
-        total_count = session.exec(select(func.count()).select_from(query.subquery())).one()
-        summaries = session.exec(query.offset((page - 1) * per_page).limit(per_page)).all()
-
-        return {
-            "total": total_count,
-            "page": page,
-            "per_page": per_page,
-            "summaries": [s.dict() for s in summaries]
-        }
+    patient_uuid = None
+    if patient_id:
+        try:
+            patient_uuid = UUID(patient_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid patient ID")
+
+    query = select(*SUMMARY_LIST_COLUMNS)
+
+    query = search_index.filter_summaries(query, file_name=file_name, patient_id=patient_uuid, keyword=keyword)
+
+    summaries, next_cursor = await _paginate(session, query, Summary, per_page, cursor)
+    total_count = await pagination.cached_count(session, query) if include_total else None
+
+    return json_response({
+        "total": total_count,
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "summaries": [s._asdict() for s in summaries]
+    })
+
+@app.get("/search", response_model=SearchPage)
+async def search_summaries(
+    q: str = Query(..., min_length=1, max_length=500),
+    patient_id: Optional[UUID] = Query(None),
+    cursor: Optional[str] = Query(None),
+    per_page: int = Query(10, ge=1, le=100),
+    session: AsyncSession = Depends(get_session),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    """Full-text search of the doctor's summaries and documents; see search_index.search for the query syntax."""
+    try:
+        results, next_cursor = await search_index.search(session, doctor.id, q, patient_id, per_page, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return json_response({
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "results": results
+    })
     
 @app.get("/summaries/{summary_id}")
-def get_summary_by_id(summary_id: UUID, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        summary = session.get(Summary, summary_id)
-        if not summary:
-            raise HTTPException(status_code=404, detail="Summary not found")
-        return summary
+async def get_summary_by_id(summary_id: UUID, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    summary = await session.get(Summary, summary_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    return summary
+
+@app.get("/summaries/{summary_id}/raw-text", response_class=PlainTextResponse)
+async def get_summary_raw_text(summary_id: UUID, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    raw_text = (await session.exec(select(Summary.raw_text).where(Summary.id == summary_id))).first()
+    if raw_text is None:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    return PlainTextResponse(raw_text)
+
+@app.get("/case/{summary_id}")
+async def get_case(
+    summary_id: UUID,
+    fields: Optional[str] = Query(None, description="Comma-separated sections to return; raw_text must be named to be included."),
+    history_limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_session),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    selected = {f.strip() for f in fields.split(",") if f.strip()} if fields else set(cases.SECTIONS)
+    unknown = selected - cases.SECTIONS - cases.HEAVY_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    if selected & cases.HEAVY_FIELDS:
+        selected.add("summary")
+
+    case = await cases.load_case(session, summary_id, selected, history_limit)
+    if case is None:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    return case
 
 ####### PDF and TXT Export #######
 
@@ -223,115 +476,93 @@ def draw_wrapped_text(pdf, text, x, y, max_width):
         y -= 14
     return y
 
+async def _summary_with_diagnosis(session: AsyncSession, summary_id: UUID) -> tuple[Summary, Optional[Diagnosis]]:
+    row = (await session.exec(
+        select(Summary, Diagnosis)
+        .options(defer(Summary.raw_text))
+        .outerjoin(Diagnosis, Diagnosis.summary_id == Summary.id)
+        .where(Summary.id == summary_id)
+    )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    return row
+
 @app.get("/export-pdf/{summary_id}")
-def export_pdf(summary_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        summary = session.get(Summary, UUID(summary_id))
-        if not summary:
-            raise HTTPException(status_code=404, detail="Summary not found")
+async def export_pdf(summary_id: UUID, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    summary, diagnosis = await _summary_with_diagnosis(session, summary_id)
+    pdf = await reports.render_pdf(summary, diagnosis)
+    return Response(pdf, media_type="application/pdf", headers={
+        "Content-Disposition": f"attachment; filename={reports.report_name(summary, 'pdf')}"
+    })
 
-        diagnosis = session.exec(
-            select(Diagnosis).where(Diagnosis.summary_id == UUID(summary_id))
-        ).first()
-
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "MedAgentX - Patient Case Report", ln=True, align="C")
-        pdf.ln(10)
-
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 8, f"Patient ID: {summary.patient_id}", ln=True)
-        pdf.cell(0, 8, f"File Name: {summary.file_name}", ln=True)
-        pdf.cell(0, 8, f"Date: {summary.created_at.strftime('%Y-%m-%d')}", ln=True)
-        pdf.ln(5)
-
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 8, "Keywords:", ln=True)
-        pdf.set_font("Arial", "", 12)
-        pdf.multi_cell(0, 8, ', '.join(summary.keywords) if summary.keywords else "N/A")
-        pdf.ln(5)
-
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 8, "Summary:", ln=True)
-        pdf.set_font("Arial", "", 12)
-        pdf.multi_cell(0, 8, summary.summary if summary.summary else "N/A")
-        pdf.ln(5)
-
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 8, "Diagnosis:", ln=True)
-        pdf.set_font("Arial", "", 12)
-        pdf.multi_cell(0, 8, diagnosis.result if diagnosis else "N/A")
-
-        pdf_output = pdf.output(dest='S').encode('latin1')
-        buffer = BytesIO(pdf_output)
-        buffer.seek(0)
-
-        return StreamingResponse(buffer, media_type="application/pdf", headers={
-            "Content-Disposition": f"attachment; filename={summary.file_name.replace('.txt','')}_report.pdf"
-        })
-    
 @app.get("/export-txt/{summary_id}")
-def export_txt(summary_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        summary = session.get(Summary, UUID(summary_id))
-        if not summary:
-            raise HTTPException(status_code=404, detail="Summary not found")
-
-        diagnosis = session.exec(select(Diagnosis).where(Diagnosis.summary_id == UUID(summary_id))).first()
-
-        content = f"""Patient ID: {summary.patient_id}
-File Name: {summary.file_name}
-Uploaded: {summary.created_at.strftime('%Y-%m-%d')}
-        
-Summary:
-{summary.summary}
-
-Notes:
-{summary.notes or 'N/A'}
-
-Diagnosis:
-{diagnosis.result if diagnosis else 'Diagnosis not available'}
-"""
-
-        return Response(content, media_type="text/plain", headers={
-            "Content-Disposition": f"attachment; filename={summary.file_name.replace('.txt', '')}_report.txt"
-        })
+async def export_txt(summary_id: UUID, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    summary, diagnosis = await _summary_with_diagnosis(session, summary_id)
+    return Response(reports.render_txt(summary, diagnosis), media_type="text/plain", headers={
+        "Content-Disposition": f"attachment; filename={reports.report_name(summary, 'txt')}"
+    })
+
+@app.get("/export")
+async def export_bulk(
+    patient_id: Optional[UUID] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    fmt: str = Query("zip", alias="format", pattern="^(zip|ndjson|csv)$"),
+    report: str = Query("pdf", pattern="^(pdf|txt)$"),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    """Stream every matching summary of a patient and/or date range as a zip of reports, NDJSON or CSV."""
+    if not patient_id and not start and not end:
+        raise HTTPException(status_code=400, detail="Give a patient_id or a start/end date range to export.")
+
+    case_rows = reports.iter_cases(doctor.id, patient_id, start, end)
+    name = f"medagentx_export_{patient_id or datetime.now(timezone.utc).strftime('%Y%m%d')}"
+    if fmt == "ndjson":
+        body, media_type, extension = reports.stream_ndjson(case_rows), "application/x-ndjson", "ndjson"
+    elif fmt == "csv":
+        body, media_type, extension = reports.stream_csv(case_rows), "text/csv", "csv"
+    else:
+        body, media_type, extension = reports.stream_zip(case_rows, report), "application/zip", "zip"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f"attachment; filename={name}.{extension}"
+    })
 
 ####### Diagnosis API #######
 
-@app.post("/diagnose")
-async def run_diagnosis(data: DiagnosisRequest, doctor: Doctor = Depends(get_current_doctor)):
+def _diagnosis_messages(summary_text: str) -> list[dict]:
     prompt = f"""
 You are a clinical assistant. Based on the following patient summary, suggest potential diagnoses and next steps a doctor should consider:
 
 Patient Summary:
-{data.summary}
+{summary_text}
 
 Respond with a clear, clinical-style explanation.
 """
-    print("Diagnosis prompt sent to GPT:", prompt)
-
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            temperature=0.3,
-            max_tokens=1000,
-            messages=[
-                {"role": "system", "content": "You are a helpful clinical assistant trained to suggest differential diagnoses and next steps based on patient summaries."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        diagnosis_text = response.choices[0].message.content
-    except Exception as e:
-        print("Diagnosis agent error: ", e)
-        diagnosis_text = "Unable to generate diagnosis due to an error."
+    return [
+        {"role": "system", "content": "You are a helpful clinical assistant trained to suggest differential diagnoses and next steps based on patient summaries."},
+        {"role": "user", "content": prompt}
+    ]
 
-    with Session(engine) as session:
-        summary_id = UUID(data.summary_id)
-        summary = session.get(Summary, summary_id)
+async def _case_inputs(summary_id: UUID) -> tuple[str, Optional[str]]:
+    """Stored summary text and current diagnosis of a summary, in one query."""
+    async with async_session() as session:
+        row = (await session.exec(
+            select(Summary.summary, Diagnosis.result)
+            .outerjoin(Diagnosis, Diagnosis.summary_id == Summary.id)
+            .where(Summary.id == summary_id)
+        )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Summary not found")
+    return row
+
+async def _diagnosis_input(data: DiagnosisRequest) -> tuple[UUID, str]:
+    summary_id = UUID(data.summary_id)
+    summary_text, _ = await _case_inputs(summary_id)
+    return summary_id, data.summary if data.summary is not None else summary_text
+
+async def _save_diagnosis(summary_id: UUID, diagnosis_text: str):
+    async with async_session() as session:
+        summary = await session.get(Summary, summary_id)
 
         if not summary:
             raise HTTPException(status_code=404, detail="Summary not found")
@@ -342,261 +573,435 @@ Respond with a clear, clinical-style explanation.
         )
         session.add(history)
 
-        diagnosis = session.exec(
-            select(Diagnosis).where(Diagnosis.summary_id == summary_id)
-        ).first()
-
-        if diagnosis:
-            diagnosis.result = diagnosis_text
-            diagnosis.created_at = datetime.now(timezone.utc)
-        else:
-            diagnosis = Diagnosis(
-                id=uuid4(),
-                summary_id=summary_id,
-                result=diagnosis_text,
-                created_at=datetime.now(timezone.utc)
-            )
-            session.add(diagnosis)
+        now = datetime.now(timezone.utc)
+        await session.exec(
+            insert(Diagnosis)
+            .values(id=uuid4(), summary_id=summary_id, result=diagnosis_text, created_at=now)
+            .on_conflict_do_update(index_elements=["summary_id"], set_={"result": diagnosis_text, "created_at": now})
+        )
+
+        await session.commit()
+        stats.invalidate(summary.doctor_id)
+        reports.invalidate(summary_id)
 
-        session.commit()
+@app.post("/diagnose")
+async def run_diagnosis(data: DiagnosisRequest, no_cache: bool = Query(False), doctor: Doctor = Depends(get_current_doctor)):
+    summary_id, summary_text = await _diagnosis_input(data)
+    # LLM failures become a 503 through llm_error_handler; nothing is stored.
+    diagnosis_text = await llm.chat_completion(
+        messages=_diagnosis_messages(summary_text),
+        use_cache=not no_cache,
+        stage="diagnosis",
+        doctor_id=doctor.id
+    )
+
+    await _save_diagnosis(summary_id, diagnosis_text)
 
     return {"diagnosis": diagnosis_text}
 
+@app.post("/diagnose/stream")
+async def run_diagnosis_stream(
+    data: DiagnosisRequest,
+    no_cache: bool = Query(False),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    summary_id, summary_text = await _diagnosis_input(data)
+    _require_llm("diagnosis")
+
+    async def events():
+        parts = []
+        try:
+            async for delta in llm.stream_chat_completion(
+                messages=_diagnosis_messages(summary_text),
+                use_cache=not no_cache,
+                stage="diagnosis",
+                doctor_id=doctor.id
+            ):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+        except llm.LLMError as e:
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+
+        diagnosis_text = "".join(parts)
+        await _save_diagnosis(summary_id, diagnosis_text)
+        yield sse_event({"diagnosis": diagnosis_text, "created_at": datetime.now(timezone.utc).isoformat()}, event="done")
+
+    return sse_response(events())
+
 @app.get("/diagnoses/{summary_id}")
-def get_diagnoses(summary_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        diagnoses = session.exec(
-            select(DiagnosisHistory)
-            .where(DiagnosisHistory.summary_id == UUID(summary_id))
-            .order_by(DiagnosisHistory.created_at.desc())
-        ).all()
-
-        return [
-            {
-                "id": str(d.id),
-                "result": d.result,
-                "created_at": d.created_at.isoformat(),
-            } for d in diagnoses
-        ]
+async def get_diagnoses(
+    summary_id: str,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    diagnoses = await _paginate_list(
+        session,
+        select(DiagnosisHistory).where(DiagnosisHistory.summary_id == UUID(summary_id)),
+        DiagnosisHistory, limit, cursor, response,
+    )
+
+    return [
+        {
+            "id": str(d.id),
+            "result": d.result,
+            "created_at": d.created_at.isoformat(),
+        } for d in diagnoses
+    ]
 
 @app.get("/diagnosis/{summary_id}")
-def get_diagnosis(summary_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        diagnosis = session.exec(
-            select(Diagnosis)
-            .where(Diagnosis.summary_id == UUID(summary_id))
-            .order_by(Diagnosis.created_at.desc())
-        ).first()
-
-        if not diagnosis:
-            return{"diagnosis": None}
-        return {
-            "diagnosis": diagnosis.result,
-            "created_at": diagnosis.created_at.isoformat(),
-            }
+async def get_diagnosis(summary_id: str, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    diagnosis = (await session.exec(
+        select(Diagnosis)
+        .where(Diagnosis.summary_id == UUID(summary_id))
+        .order_by(Diagnosis.created_at.desc())
+    )).first()
+
+    if not diagnosis:
+        return{"diagnosis": None}
+    return {
+        "diagnosis": diagnosis.result,
+        "created_at": diagnosis.created_at.isoformat(),
+        }
 
 ####### Feedback API #######
 
 @app.post("/feedback")
-def save_feedback(data: FeedbackRequest, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        feedback = Feedback(
-            summary_id = UUID(data.summary_id),
-            helpful = data.helpful,
-            comment = data.comment
-        )
-        session.add(feedback)
-        session.commit()
+async def save_feedback(data: FeedbackRequest, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    feedback = Feedback(
+        summary_id = UUID(data.summary_id),
+        helpful = data.helpful,
+        comment = data.comment
+    )
+    session.add(feedback)
+    await session.commit()
+    stats.invalidate()
     return {"message": "Feedback saved successfully."}
 
 @app.get("/feedbacks")
-def get_feedbacks(doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        feedbacks = session.exec(select(Feedback)).all()
-        return feedbacks
+async def get_feedbacks(
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    return await _paginate_list(session, select(Feedback), Feedback, limit, cursor, response)
 
 @app.get("/feedback/{summary_id}")
-def get_feedback(summary_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        feedback = session.exec(select(Feedback).where(Feedback.summary_id == summary_id)).first()
-        if not feedback:
-            return {"message": "No feedback found for this summary."}
-        return feedback
+async def get_feedback(summary_id: str, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    feedback = (await session.exec(select(Feedback).where(Feedback.summary_id == UUID(summary_id)))).first()
+    if not feedback:
+        return {"message": "No feedback found for this summary."}
+    return feedback
     
+####### LLM Cache #######
+
+@app.get("/llm-cache/stats")
+async def get_llm_cache_stats(doctor: Doctor = Depends(get_current_doctor)):
+    return llm_cache.snapshot()
+
+@app.get("/auth-cache/stats")
+async def get_auth_cache_stats(doctor: Doctor = Depends(get_current_doctor)):
+    return auth_utils.snapshot()
+
 ####### Dashboard #######
 
 @app.get('/dashboard-stats')
-def get_dashboard_stats(doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        total_summaries = len(session.exec(select(Summary)).all())
-        total_diagnoses = len(session.exec(select(Diagnosis)).all())
-        total_feedbacks = len(session.exec(select(Feedback)).all())
-        # avg_feedback = session.exec(select(func.avg(Feedback.helpful))).first()
-
-        return {
-            "total_summaries": total_summaries,
-            "total_diagnoses": total_diagnoses,
-            "total_feedbacks": total_feedbacks,
-            # "average_feedback": round(avg_feedback[0], 2) if avg_feedback[0] else "N/A",
-        }
+async def get_dashboard_stats(session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    return await stats.get_dashboard_stats(session, doctor.id)
     
-@app.get("/recent-summaries")
-def get_recent_summaries(doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        summaries = session.exec(
-            select(Summary).order_by(Summary.created_at.desc()).limit(5)
-        ).all()
-        return summaries
-
-@app.post("/recommendations")
-def generate_recommendations(data: RecommendationRequest, doctor: Doctor = Depends(get_current_doctor)):
+@app.get("/recent-summaries", response_model=List[RecentSummary])
+async def get_recent_summaries(session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    summaries = (await session.exec(
+        select(*RECENT_SUMMARY_COLUMNS).order_by(Summary.created_at.desc()).limit(5)
+    )).all()
+    return json_response([s._asdict() for s in summaries])
+
+def _recommendation_messages(summary_text: str, diagnosis_text: str) -> list[dict]:
     prompt = f"""
     You are a helpful and professional medical assistant. Based on the following patient summary and diagnosis, suggest clear and concise medical recommendations for the doctor.
 
     Patient Summary:
-    {data.summary}
+    {summary_text}
 
     Diagnosis:
-    {data.diagnosis}
+    {diagnosis_text}
 
     Recommendations:
     """
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=500,
-        temperature=0.3
-    )
-    recommendations_text = response.choices[0].message.content.strip()
-
-    with Session(engine) as session:
+    return [{"role": "user", "content": prompt}]
+
+async def _recommendation_input(data: RecommendationRequest) -> tuple[UUID, str, str]:
+    summary_id = UUID(data.summary_id)
+    stored_summary, stored_diagnosis = await _case_inputs(summary_id)
+    summary_text = data.summary if data.summary is not None else stored_summary
+    diagnosis_text = data.diagnosis if data.diagnosis is not None else stored_diagnosis
+    if diagnosis_text is None:
+        raise HTTPException(status_code=400, detail="This summary has no diagnosis yet.")
+    return summary_id, summary_text, diagnosis_text
+
+async def _save_recommendations(summary_id: UUID, recommendations_text: str):
+    async with async_session() as session:
         history = RecommendationHistory(
-            summary_id=UUID(data.summary_id),
+            summary_id=summary_id,
             result=recommendations_text,
         )
         session.add(history)
-        session.commit()
+        await session.commit()
+
+@app.post("/recommendations")
+async def generate_recommendations(data: RecommendationRequest, no_cache: bool = Query(False), doctor: Doctor = Depends(get_current_doctor)):
+    summary_id, summary_text, diagnosis_text = await _recommendation_input(data)
+    recommendations_text = (await llm.chat_completion(
+        messages=_recommendation_messages(summary_text, diagnosis_text),
+        use_cache=not no_cache,
+        stage="recommendation",
+        doctor_id=doctor.id
+    )).strip()
+
+    await _save_recommendations(summary_id, recommendations_text)
 
     return {"recommendations": recommendations_text}
 
+@app.post("/recommendations/stream")
+async def generate_recommendations_stream(data: RecommendationRequest, no_cache: bool = Query(False), doctor: Doctor = Depends(get_current_doctor)):
+    summary_id, summary_text, diagnosis_text = await _recommendation_input(data)
+    _require_llm("recommendation")
+
+    async def events():
+        parts = []
+        try:
+            async for delta in llm.stream_chat_completion(
+                messages=_recommendation_messages(summary_text, diagnosis_text),
+                use_cache=not no_cache,
+                stage="recommendation",
+                doctor_id=doctor.id
+            ):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+        except llm.LLMError as e:
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+
+        recommendations_text = "".join(parts).strip()
+        await _save_recommendations(summary_id, recommendations_text)
+        yield sse_event({"recommendations": recommendations_text}, event="done")
+
+    return sse_response(events())
+
 @app.get("/recommendations/{summary_id}")
-def get_recommendations(summary_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        recommendations = session.exec(
-            select(RecommendationHistory)
-            .where(RecommendationHistory.summary_id == UUID(summary_id))
-            .order_by(RecommendationHistory.created_at.desc())
-        ).all()
-
-        return [
-            {
-                "id": str(r.id),
-                "result": r.result,
-                "created_at": r.created_at.isoformat(),
-            } for r in recommendations
-        ]
+async def get_recommendations(
+    summary_id: str,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    recommendations = await _paginate_list(
+        session,
+        select(RecommendationHistory).where(RecommendationHistory.summary_id == UUID(summary_id)),
+        RecommendationHistory, limit, cursor, response,
+    )
+
+    return [
+        {
+            "id": str(r.id),
+            "result": r.result,
+            "created_at": r.created_at.isoformat(),
+        } for r in recommendations
+    ]
     
+####### Pipeline API #######
+
+@app.post("/pipeline")
+async def run_pipeline(
+    file: Optional[UploadFile] = File(None),
+    summary_id: Optional[str] = Form(None),
+    patient_id: Optional[str] = Form(None),
+    notes: Optional[str] = Form(None),
+    no_cache: bool = Query(False),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    """
+    Summarize an upload (or start from a stored summary), diagnose and recommend
+    in one request. Inputs are read from the database, not echoed by the
+    client, and each stage is stored as soon as it finishes: storing the
+    diagnosis overlaps with the recommendation call. Progress is streamed as
+    one SSE event per stage.
+    """
+    if (file is None) == (summary_id is None):
+        raise HTTPException(status_code=400, detail="Send either a file or a summary_id.")
+    _require_llm("summary", "diagnosis", "recommendation")
+
+    case_id, summary_text = None, None
+    if file is not None:
+        if not patient_id:
+            raise HTTPException(status_code=400, detail="patient_id is required when uploading a file.")
+        _check_patient_id(patient_id)
+        try:
+            path, file_hash = await extraction.spool_upload(file)
+        except ValueError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        file_name = file.filename
+    else:
+        case_id = UUID(summary_id)
+        summary_text, _ = await _case_inputs(case_id)
+
+    use_cache = not no_cache
+
+    async def events():
+        nonlocal summary_text, case_id
+        if file is not None:
+            try:
+                summary_record = await documents.summarize_upload(
+                    file_name, path, file_hash, patient_id, notes, doctor.id, use_cache, priority=scheduler.INTERACTIVE
+                )
+            except (ValueError, extraction.ExtractionUnavailable, llm.LLMError) as e:
+                yield sse_event({"stage": "summary", "detail": str(e)}, event="error")
+                return
+            finally:
+                extraction.remove(path)
+            case_id, summary_text = summary_record.id, summary_record.summary
+            yield sse_event({"summary_id": str(case_id), "summary": summary_text, "keywords": summary_record.keywords}, event="summary")
+
+        try:
+            diagnosis_text = await llm.chat_completion(
+                messages=_diagnosis_messages(summary_text),
+                use_cache=use_cache,
+                stage="diagnosis",
+                doctor_id=doctor.id
+            )
+        except llm.LLMError as e:
+            yield sse_event({"stage": "diagnosis", "detail": str(e)}, event="error")
+            return
+
+        # The recommendation call only needs the diagnosis text, so it starts
+        # while the diagnosis is being stored.
+        recommending = asyncio.create_task(llm.chat_completion(
+            messages=_recommendation_messages(summary_text, diagnosis_text),
+            use_cache=use_cache,
+            stage="recommendation",
+            doctor_id=doctor.id
+        ))
+        try:
+            await _save_diagnosis(case_id, diagnosis_text)
+            yield sse_event({"diagnosis": diagnosis_text, "created_at": datetime.now(timezone.utc).isoformat()}, event="diagnosis")
+
+            try:
+                recommendations_text = (await recommending).strip()
+            except llm.LLMError as e:
+                yield sse_event({"stage": "recommendations", "detail": str(e)}, event="error")
+                return
+        finally:
+            recommending.cancel()
+
+        await _save_recommendations(case_id, recommendations_text)
+        yield sse_event({"recommendations": recommendations_text}, event="recommendations")
+        yield sse_event({"summary_id": str(case_id)}, event="done")
+
+    # events() removes the upload as soon as it is summarized; the response
+    # also removes it in case the client leaves before events() starts.
+    return sse_response(events(), on_close=(lambda: extraction.remove(path)) if file is not None else None)
+
 ########## Patient API #######
 
 @app.post("/patients", response_model=Patient)
-def create_patient(patient: Patient, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        patient.doctor_id = doctor.id
-        session.add(patient)
-        session.commit()
-        session.refresh(patient)
-        return patient
+async def create_patient(patient: Patient, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    patient.doctor_id = doctor.id
+    session.add(patient)
+    await session.commit()
+    await session.refresh(patient)
+    return patient
 
 @app.get("/patients", response_model=List[Patient])
-def get_patients(doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        patients = session.exec(select(Patient)).all()
-        return patients
+async def get_patients(
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(get_session),
+    doctor: Doctor = Depends(get_current_doctor)
+):
+    return await _paginate_list(session, patients.list_query(), Patient, limit, cursor, response)
+
+@app.get("/patients/options", response_model=List[PatientOption])
+async def get_patient_options(session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    """Every patient of the doctor, by name, for pickers; unlike /patients it is not paged."""
+    options = (await session.exec(patients.options_query(doctor.id))).all()
+    return json_response([o._asdict() for o in options])
 
 @app.get("/patients/{patient_id}", response_model=Patient)
-def get_patient(patient_id: UUID, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        patient = session.get(Patient, patient_id)
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-        return patient
+async def get_patient(patient_id: UUID, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    patient = await session.get(Patient, patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return patient
 
 @app.put("/patients/{patient_id}", response_model=Patient)
-def update_patient(patient_id: UUID, updated_patient: Patient, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        patient = session.get(Patient, patient_id)
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-
-        patient.name = updated_patient.name
-        patient.gender = updated_patient.gender
-        patient.age = updated_patient.age
-        patient.contact = updated_patient.contact
-
-        session.commit()
-        session.refresh(patient)
-        return patient
-
-@app.delete("/patients/{patient_id}", status_code=204)
-def delete_patient(patient_id: str, doctor: Doctor = Depends(get_current_doctor)):
-    with Session(engine) as session:
-        patient = session.get(Patient, patient_id)
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
-
-        summaries = session.exec(select(Summary).where(Summary.patient_id == patient_id)).all()
-        for summary in summaries:
-            session.exec(
-                delete(Diagnosis).where(Diagnosis.summary_id == summary.id)
-            )
-            session.exec(
-                delete(DiagnosisHistory).where(DiagnosisHistory.summary_id == summary.id)
-            )
-            session.exec(
-                delete(RecommendationHistory).where(RecommendationHistory.summary_id == summary.id)
-            )
-            session.delete(summary)
+async def update_patient(patient_id: UUID, updated_patient: Patient, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    patient = await session.get(Patient, patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    patient.name = updated_patient.name
+    patient.gender = updated_patient.gender
+    patient.age = updated_patient.age
+    patient.contact = updated_patient.contact
 
-        session.delete(patient)
-        session.commit()
+    await session.commit()
+    await session.refresh(patient)
+    return patient
 
-    return {"message": "Patient and related summaries deleted successfully."}
+@app.delete("/patients/{patient_id}")
+async def delete_patient(patient_id: UUID, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    deleted = await patients.delete_patients(session, [patient_id], doctor.id)
+    if not deleted["patients"]:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    return {"message": "Patient and related summaries deleted successfully.", "deleted": deleted}
+
+@app.post("/patients/bulk-delete")
+async def delete_patients(data: PatientBulkDeleteRequest, session: AsyncSession = Depends(get_session), doctor: Doctor = Depends(get_current_doctor)):
+    deleted = await patients.delete_patients(session, data.patient_ids, doctor.id)
+    return {"message": f"{deleted['patients']} patients and related summaries deleted successfully.", "deleted": deleted}
 
 ####### Doctor API #######
 
 @app.post("/login")
-def login(data: DoctorLoginRequest):
-    with Session(engine) as session:
-        doctor = session.exec(select(Doctor).where(Doctor.email == data.email)).first()
-        if not doctor or not doctor.verify_password(data.password):
-            raise HTTPException(status_code=401, detail="Invalid email or password")
+async def login(data: DoctorLoginRequest, session: AsyncSession = Depends(get_session)):
+    doctor = (await session.exec(select(Doctor).where(Doctor.email == data.email))).first()
+    # bcrypt is deliberately slow; keep it off the event loop.
+    if not doctor or not await asyncio.to_thread(doctor.verify_password, data.password):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
 
-        access_token = create_access_token(data={"sub": str(doctor.id)})
-        return {"access_token": access_token, "token_type": "bearer"}
+    access_token = create_doctor_token(doctor)
+    return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/register")
-def register(data: DoctorRegisterRequest):
-    with Session(engine) as session:
-        existing_doctor = session.exec(select(Doctor).where(Doctor.email == data.email)).first()
-        if existing_doctor:
-            raise HTTPException(status_code=400, detail="A doctor with this email already exists")
-
-        hashed_password = Doctor.hash_password(data.password)
-        doctor = Doctor(
-            username=data.username,
-            email=data.email,
-            hashed_password=hashed_password
-        )
-        session.add(doctor)
-        session.commit()
-        session.refresh(doctor)
+async def register(data: DoctorRegisterRequest, session: AsyncSession = Depends(get_session)):
+    existing_doctor = (await session.exec(select(Doctor).where(Doctor.email == data.email))).first()
+    if existing_doctor:
+        raise HTTPException(status_code=400, detail="A doctor with this email already exists")
+
+    hashed_password = await asyncio.to_thread(Doctor.hash_password, data.password)
+    doctor = Doctor(
+        username=data.username,
+        email=data.email,
+        hashed_password=hashed_password
+    )
+    session.add(doctor)
+    await session.commit()
 
-        access_token = create_access_token(data={"sub": str(doctor.id)})
-        return {"access_token": access_token, "token_type": "bearer"}
+    access_token = create_doctor_token(doctor)
+    return {"access_token": access_token, "token_type": "bearer"}
     
 
 @app.get("/account")
-def get_account(doctor: Doctor = Depends(get_current_doctor)):
+async def get_account(doctor: Doctor = Depends(get_current_doctor)):
     return {
         "id": str(doctor.id),
         "username": doctor.username,
@@ -604,22 +1009,23 @@ def get_account(doctor: Doctor = Depends(get_current_doctor)):
     }
 
 @app.put("/account/update")
-def update_account(
+async def update_account(
     data: DoctorUpdate,
+    session: AsyncSession = Depends(get_session),
     doctor: Doctor = Depends(get_current_doctor)
 ):
-    with Session(engine) as session:
-        db_doctor = session.get(Doctor, doctor.id)
-        if not db_doctor:
-            raise HTTPException(status_code=404, detail="Doctor not found")
-
-        if data.username:
-            db_doctor.username = data.username
-        if data.email:
-            db_doctor.email = data.email
-        if data.password:
-            db_doctor.hashed_password = Doctor.hash_password(data.password)             
-        
-        session.commit()
-        session.refresh(db_doctor)
-        return {"message": "Account updated successfully."}
+    db_doctor = await session.get(Doctor, doctor.id)
+    if not db_doctor:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+
+    if data.username:
+        db_doctor.username = data.username
+    if data.email:
+        db_doctor.email = data.email
+    if data.password:
+        db_doctor.hashed_password = await asyncio.to_thread(Doctor.hash_password, data.password)
+
+    await session.commit()
+    await session.refresh(db_doctor)
+    auth_utils.invalidate(db_doctor.id)
+    return {"message": "Account updated successfully.", "access_token": create_doctor_token(db_doctor), "token_type": "bearer"}
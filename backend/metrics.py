@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv()
+
+# Share of routine events (LLM calls, saved summaries) that are logged; errors are always logged.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.05"))
+# Prompts hold patient data, so only their size is logged unless this is enabled.
+LOG_PROMPTS = os.getenv("LOG_PROMPTS", "false").lower() == "true"
+LOG_PROMPT_CHARS = int(os.getenv("LOG_PROMPT_CHARS", "500"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Metrics are updated from the event loop and from worker threads.
+_lock = threading.Lock()
+_registry: list = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], le: str | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """A value that goes up and down; inc() with a negative amount lowers it."""
+    kind = "gauge"
+
+class _Timer:
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram, self.labels = histogram, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        # Per label set: observations per bucket (not cumulative), sum and count.
+        self._values: dict[tuple[str, ...], list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """Context manager observing the duration of its block."""
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, str(bound))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, '+Inf')} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render() -> str:
+    """All metrics of this worker process in the Prometheus text format."""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+####### Metrics #######
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts, by route template. Streaming responses are timed to their first byte.",
+    ("method", "route", "status"),
+)
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "OpenAI chat completion latency, cache hits excluded.", ("stage", "model"),
+)
+llm_tokens = Counter("llm_tokens_total", "Tokens used by OpenAI chat completions.", ("stage", "model", "kind"))
+llm_errors = Counter("llm_errors_total", "Failed OpenAI chat completions.", ("stage", "error"))
+llm_cache_hits = Counter("llm_cache_hits_total", "Chat completions answered from the LLM cache.", ("stage",))
+llm_retries = Counter("llm_retries_total", "Chat completion attempts retried, by the error that caused it.", ("stage", "error"))
+llm_hedges = Counter("llm_hedges_total", "Hedged second requests sent for slow chat completions.", ("stage",))
+llm_breaker_opened = Counter("llm_breaker_opened_total", "Times a model's circuit breaker opened.", ("model",))
+llm_breaker_rejections = Counter("llm_breaker_rejections_total", "Calls refused while a model's circuit was open.", ("model",))
+llm_queue_wait = Histogram(
+    "llm_queue_wait_seconds", "Time chat completions waited in the scheduler for a slot and budget.", ("priority",),
+)
+llm_queue_depth = Gauge("llm_queue_depth", "Chat completions waiting in the scheduler.", ("priority",))
+llm_queue_timeouts = Counter("llm_queue_timeouts_total", "Chat completions that gave up waiting in the scheduler.", ("priority",))
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time, by leading keyword.", ("operation",),
+)
+extraction_duration = Histogram("extraction_duration_seconds", "Text extraction time per document.", ("kind",))
+keyword_scan_duration = Histogram("keyword_scan_duration_seconds", "Keyword extraction time per document.")
+
+def instrument_engine(engine):
+    """Time every statement run through the (async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "EMPTY"
+        db_query_duration.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute; drop its start
+        # so the next statement on the connection is not timed from it.
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording http_request_duration. It only wraps send, so
+    streamed bodies pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            nonlocal recorded
+            recorded = True
+            # Labelled by route template so path parameters do not create new series.
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                record(500)
+
+####### Logging #######
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3), "level": record.levelname.lower(), "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+# Records are handed to a queue and written by a listener thread, so logging
+# never blocks the event loop on stdout.
+logger = logging.getLogger("medagentx")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_queue: SimpleQueue = SimpleQueue()
+logger.addHandler(QueueHandler(_queue))
+_handler = logging.StreamHandler()
+_handler.setFormatter(_JsonFormatter())
+_listener = QueueListener(_queue, _handler)
+
+def log_event(name: str, sampled: bool = True, level: int = logging.INFO, **fields):
+    """One JSON log line. Sampled events are kept with probability LOG_SAMPLE_RATE."""
+    if sampled and random.random() >= LOG_SAMPLE_RATE:
+        return
+    logger.log(level, name, extra={"fields": fields})
+
+def prompt_fields(messages: list[dict]) -> dict:
+    """What an LLM log line records about its prompt."""
+    fields = {"prompt_chars": sum(len(m.get("content") or "") for m in messages)}
+    if LOG_PROMPTS:
+        fields["prompt"] = (messages[-1].get("content") or "")[:LOG_PROMPT_CHARS]
+    return fields
+
+def start():
+    _listener.start()
+
+def shutdown():
+    """Write out queued log lines and stop the listener thread."""
+    _listener.stop()
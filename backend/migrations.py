@@ -0,0 +1,182 @@
+import asyncio
+import sys
+from uuid import uuid4
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+import metrics
+import search_index
+
+def _to_timestamptz(table: str, column: str) -> str:
+    return f"""
+    DO $$ BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = '{table}' AND column_name = '{column}' AND data_type = 'timestamp without time zone'
+        ) THEN
+            ALTER TABLE {table} ALTER COLUMN {column} TYPE TIMESTAMPTZ USING {column} AT TIME ZONE 'UTC';
+        END IF;
+    END $$
+    """
+
+# Applied in order, once per database, after create_all. Every statement is
+# idempotent so a database that already has some of them upgrades cleanly.
+MIGRATIONS: list[tuple[str, list[str]]] = [
+    ("0001_summary_content_hash", [
+        "ALTER TABLE summary ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+        "CREATE INDEX IF NOT EXISTS ix_summary_content_hash ON summary (content_hash)",
+    ]),
+    ("0002_search_index", search_index.SEARCH_INDEX_DDL),
+    ("0003_timestamptz", [
+        # Timestamps were stored as naive UTC; asyncpg refuses to bind aware datetimes to them.
+        _to_timestamptz("summary", "created_at"),
+        _to_timestamptz("patient", "created_at"),
+        _to_timestamptz("feedback", "created_at"),
+        _to_timestamptz("diagnosis", "created_at"),
+        _to_timestamptz("diagnosishistory", "created_at"),
+        _to_timestamptz("recommendationhistory", "created_at"),
+        _to_timestamptz("job", "run_after"),
+        _to_timestamptz("job", "created_at"),
+        _to_timestamptz("job", "updated_at"),
+        _to_timestamptz("llmcacheentry", "created_at"),
+        _to_timestamptz("llmcacheentry", "last_used_at"),
+    ]),
+    ("0004_lookup_indexes", [
+        # Listings are paged newest first on (created_at, id) within their parent.
+        "CREATE INDEX IF NOT EXISTS ix_summary_created_at ON summary (created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_summary_patient_id_created_at ON summary (patient_id, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_summary_doctor_id_created_at ON summary (doctor_id, created_at DESC, id DESC)",
+        "DROP INDEX IF EXISTS ix_summary_patient_id",
+        "CREATE INDEX IF NOT EXISTS ix_patient_doctor_id_created_at ON patient (doctor_id, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_patient_created_at ON patient (created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_diagnosishistory_summary_id_created_at ON diagnosishistory (summary_id, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_recommendationhistory_summary_id_created_at ON recommendationhistory (summary_id, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_feedback_summary_id_created_at ON feedback (summary_id, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_feedback_created_at ON feedback (created_at DESC, id DESC)",
+    ]),
+    ("0005_diagnosis_unique_summary", [
+        # Keep only the newest current diagnosis per summary before enforcing one.
+        """
+        DELETE FROM diagnosis d USING diagnosis newer
+        WHERE d.summary_id = newer.summary_id AND (d.created_at, d.id) < (newer.created_at, newer.id)
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_diagnosis_summary_id ON diagnosis (summary_id)",
+    ]),
+    ("0006_feedback_summary_fk", [
+        "DELETE FROM feedback f WHERE NOT EXISTS (SELECT 1 FROM summary s WHERE s.id = f.summary_id)",
+        """
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'feedback_summary_id_fkey') THEN
+                ALTER TABLE feedback ADD CONSTRAINT feedback_summary_id_fkey
+                    FOREIGN KEY (summary_id) REFERENCES summary (id) ON DELETE CASCADE;
+            END IF;
+        END $$
+        """,
+    ]),
+    ("0007_summary_fulltext", search_index.FULLTEXT_DDL),
+]
+
+async def migrate(conn: AsyncConnection):
+    """Apply the migrations this database has not seen yet, recording each in schema_migration."""
+    # Serializes workers that start at the same time; released at commit.
+    await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('medagentx-migrations'))"))
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migration (name VARCHAR PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    ))
+    applied = set((await conn.execute(text("SELECT name FROM schema_migration"))).scalars())
+    for name, statements in MIGRATIONS:
+        if name in applied:
+            continue
+        for statement in statements:
+            await conn.execute(text(statement))
+        await conn.execute(text("INSERT INTO schema_migration (name) VALUES (:name)"), {"name": name})
+        metrics.log_event("migration_applied", sampled=False, name=name)
+
+####### Index check #######
+
+# The lookups the API runs on every page view, with the index each must use.
+HOT_QUERIES = {
+    "summaries_by_patient": (
+        "SELECT * FROM summary WHERE patient_id = :id ORDER BY created_at DESC, id DESC LIMIT 10",
+        "ix_summary_patient_id_created_at",
+    ),
+    "summaries_by_doctor": (
+        "SELECT count(*) FROM summary WHERE doctor_id = :id",
+        "ix_summary_doctor_id_created_at",
+    ),
+    "current_diagnosis": (
+        "SELECT * FROM diagnosis WHERE summary_id = :id",
+        "ux_diagnosis_summary_id",
+    ),
+    "diagnosis_history": (
+        "SELECT * FROM diagnosishistory WHERE summary_id = :id ORDER BY created_at DESC, id DESC LIMIT 100",
+        "ix_diagnosishistory_summary_id_created_at",
+    ),
+    "recommendation_history": (
+        "SELECT * FROM recommendationhistory WHERE summary_id = :id ORDER BY created_at DESC, id DESC LIMIT 100",
+        "ix_recommendationhistory_summary_id_created_at",
+    ),
+    "fulltext_by_doctor": (
+        "SELECT id FROM summary WHERE doctor_id = :id AND search_vector @@ websearch_to_tsquery('english', 'chest pain')",
+        "ix_summary_search_vector",
+    ),
+    "feedback_by_summary": (
+        "SELECT * FROM feedback WHERE summary_id = :id",
+        "ix_feedback_summary_id_created_at",
+    ),
+}
+
+def _app_queries() -> dict[str, tuple[str, str]]:
+    """
+    Hot queries built by the same helpers as the endpoints that run them, so
+    the check follows the code. Imported here because db imports this module.
+    """
+    import pagination
+    import patients
+    from models import Patient
+
+    statements = {
+        "patients_page": (
+            pagination.page_query(patients.list_query(), Patient, pagination.DEFAULT_PAGE_SIZE),
+            "ix_patient_created_at",
+        ),
+        "patient_options": (patients.options_query(uuid4()), "ix_patient_doctor_id_created_at"),
+    }
+    return {
+        name: (str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})), index)
+        for name, (statement, index) in statements.items()
+    }
+
+async def check_indexes(engine: AsyncEngine) -> dict[str, str]:
+    """
+    EXPLAIN every hot query and return the ones whose plan does not use the
+    expected index, mapped to their plan. Sequential scans are disabled for
+    the check so a small development database gives the same answer as a
+    large one.
+    """
+    failures = {}
+    async with engine.connect() as conn:
+        await conn.execute(text("SET enable_seqscan = off"))
+        for name, (sql, index) in {**HOT_QUERIES, **_app_queries()}.items():
+            rows = await conn.execute(text(f"EXPLAIN {sql}"), {"id": uuid4()})
+            plan = "\n".join(row[0] for row in rows)
+            if index not in plan:
+                failures[name] = plan
+    return failures
+
+async def _main():
+    from db import engine, init_db
+    metrics.start()
+    try:
+        await init_db()
+        failures = await check_indexes(engine)
+    finally:
+        await engine.dispose()
+        metrics.shutdown()
+    for name, plan in failures.items():
+        print(f"{name} does not use its index:\n{plan}\n")
+    print("All hot queries use their indexes." if not failures else f"{len(failures)} queries without index scans.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -2,7 +2,7 @@ from typing import Annotated, Optional, Any
 from datetime import datetime, timezone
 from sqlmodel import SQLModel, Field
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, DateTime, ForeignKey
 import uuid
 from uuid import UUID, uuid4
 from passlib.hash import bcrypt
@@ -17,7 +17,49 @@ class Summary(SQLModel, table=True):
     summary: Optional[str] = None
     keywords: Optional[Any] = Field(default=None, sa_column=Column(JSONB))
     notes: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    content_hash: Optional[str] = Field(default=None, index=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+
+class SummaryListItem(SQLModel):
+    """Columns list views show; raw_text is only served by /summaries/{id}/raw-text."""
+    id: UUID
+    patient_id: Optional[UUID] = None
+    doctor_id: UUID
+    file_name: Optional[str] = None
+    summary: Optional[str] = None
+    keywords: Optional[Any] = None
+    notes: Optional[str] = None
+    created_at: datetime
+
+class SummaryPage(SQLModel):
+    total: Optional[int] = None
+    per_page: int
+    next_cursor: Optional[str] = None
+    summaries: list[SummaryListItem]
+
+class SearchResult(SQLModel):
+    id: UUID
+    patient_id: Optional[UUID] = None
+    file_name: Optional[str] = None
+    created_at: datetime
+    rank: float
+    summary_highlight: Optional[str] = None
+    text_highlight: Optional[str] = None
+
+class SearchPage(SQLModel):
+    per_page: int
+    next_cursor: Optional[str] = None
+    results: list[SearchResult]
+
+class RecentSummary(SQLModel):
+    id: UUID
+    patient_id: Optional[UUID] = None
+    file_name: Optional[str] = None
+    created_at: datetime
+
+class SummaryKeyword(SQLModel, table=True):
+    summary_id: uuid.UUID = Field(sa_column=Column(ForeignKey("summary.id", ondelete="CASCADE"), primary_key=True))
+    keyword: str = Field(primary_key=True)
 
 class Patient(SQLModel, table=True):
     id: UUID = Field(default_factory=uuid4, primary_key=True)
@@ -26,32 +68,58 @@ class Patient(SQLModel, table=True):
     age: Optional[int] = None
     gender: Optional[str] = None
     contact: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+
+class PatientOption(SQLModel):
+    """What patient pickers need; /patients/options returns every patient of the doctor in this shape."""
+    id: UUID
+    name: str
 
 class Feedback(SQLModel, table=True):
     id: UUID = Field(default_factory=uuid4, primary_key=True)
-    summary_id: UUID
+    summary_id: UUID = Field(sa_column=Column(ForeignKey("summary.id", ondelete="CASCADE"), nullable=False))
     helpful: bool
     comment: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
 
 class Diagnosis(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     summary_id: uuid.UUID = Field(sa_column=Column(ForeignKey("summary.id", ondelete="CASCADE")))
     result: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
 
 class DiagnosisHistory(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     summary_id: uuid.UUID = Field(sa_column=Column(ForeignKey("summary.id", ondelete="CASCADE")))
     result: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
 
 class RecommendationHistory(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     summary_id: uuid.UUID = Field(sa_column=Column(ForeignKey("summary.id", ondelete="CASCADE")))
     result: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+
+class Job(SQLModel, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    kind: str
+    status: str = Field(default="queued", index=True)
+    doctor_id: UUID = Field(foreign_key="doctor.id", nullable=False)
+    payload: Optional[Any] = Field(default=None, sa_column=Column(JSONB))
+    result: Optional[Any] = Field(default=None, sa_column=Column(JSONB))
+    error: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 1
+    run_after: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+
+class LLMCacheEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    model: str
+    response: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+    last_used_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True), index=True)
 
 class Doctor(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, nullable=False)
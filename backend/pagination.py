@@ -0,0 +1,81 @@
+import base64
+import json
+import os
+import time
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy import func, tuple_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+# Seconds a listing total is reused for the same filters. Totals are for
+# display only, so a briefly stale count is cheaper than a COUNT per page.
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "1024"))
+
+_counts: dict[str, tuple[float, int]] = {}
+
+def _encode(values: list) -> str:
+    payload = json.dumps(values)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode(cursor: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    return _encode([created_at.isoformat(), str(id)])
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        created_at, id = _decode(cursor)
+        return datetime.fromisoformat(created_at), UUID(id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def encode_rank_cursor(rank: float, created_at: datetime, id: UUID) -> str:
+    """Cursor of a ranked listing, ordered by (rank, created_at, id) descending."""
+    return _encode([rank, created_at.isoformat(), str(id)])
+
+def decode_rank_cursor(cursor: str) -> tuple[float, datetime, UUID]:
+    """Inverse of encode_rank_cursor; raises ValueError for anything it did not produce."""
+    try:
+        rank, created_at, id = _decode(cursor)
+        return float(rank), datetime.fromisoformat(created_at), UUID(id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def page_query(query, model, limit: int, cursor: str | None = None):
+    """The statement paginate() runs: one row past the page, so it can tell whether another page follows."""
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(created_at, id))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+async def paginate(session: AsyncSession, query, model, limit: int, cursor: str | None = None) -> tuple[list, str | None]:
+    """
+    Return one page of query, newest first, and the cursor of the next page
+    (None on the last page). Pages are keyed on (created_at, id), so the cost of
+    a page does not grow with how deep it is.
+    """
+    rows = (await session.exec(page_query(query, model, limit, cursor))).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+async def cached_count(session: AsyncSession, query) -> int:
+    """COUNT of query, reused for COUNT_CACHE_TTL seconds per distinct statement and parameters."""
+    compiled = query.compile()
+    key = f"{compiled}|{sorted((k, str(v)) for k, v in compiled.params.items())}"
+    cached = _counts.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    total = (await session.exec(select(func.count()).select_from(query.subquery()))).one()
+    if len(_counts) >= COUNT_CACHE_SIZE:
+        _counts.clear()
+    _counts[key] = (time.monotonic() + COUNT_CACHE_TTL, total)
+    return total
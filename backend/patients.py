@@ -0,0 +1,40 @@
+from uuid import UUID
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Summary, SummaryKeyword, Feedback, Diagnosis, DiagnosisHistory, RecommendationHistory, Patient
+import stats
+
+def list_query():
+    """Patients listed by GET /patients, before paging."""
+    return select(Patient)
+
+def options_query(doctor_id: UUID):
+    """Id and name of every patient of the doctor, by name, as GET /patients/options returns them."""
+    return select(Patient.id, Patient.name).where(Patient.doctor_id == doctor_id).order_by(Patient.name, Patient.id)
+
+async def delete_patients(session: AsyncSession, patient_ids: list[UUID], doctor_id: UUID) -> dict[str, int]:
+    """
+    Delete the doctor's patients and everything recorded against their
+    summaries in one transaction. Each table is cleared with a single
+    set-based statement, so the number of queries does not depend on how many
+    documents the patients have. Returns the rows deleted per table.
+    """
+    owned = select(Patient.id).where(Patient.id.in_(patient_ids), Patient.doctor_id == doctor_id)
+    summary_ids = select(Summary.id).where(Summary.patient_id.in_(owned))
+
+    counts = {}
+    for name, statement in [
+        ("feedback", delete(Feedback).where(Feedback.summary_id.in_(summary_ids))),
+        ("diagnoses", delete(Diagnosis).where(Diagnosis.summary_id.in_(summary_ids))),
+        ("diagnosis_history", delete(DiagnosisHistory).where(DiagnosisHistory.summary_id.in_(summary_ids))),
+        ("recommendations", delete(RecommendationHistory).where(RecommendationHistory.summary_id.in_(summary_ids))),
+        ("keywords", delete(SummaryKeyword).where(SummaryKeyword.summary_id.in_(summary_ids))),
+        ("summaries", delete(Summary).where(Summary.patient_id.in_(owned))),
+        ("patients", delete(Patient).where(Patient.id.in_(patient_ids), Patient.doctor_id == doctor_id)),
+    ]:
+        result = await session.exec(statement)
+        counts[name] = result.rowcount
+    await session.commit()
+
+    stats.invalidate(doctor_id)
+    return counts
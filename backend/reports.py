@@ -0,0 +1,230 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from uuid import UUID
+from fpdf import FPDF
+from sqlalchemy import tuple_
+from sqlalchemy.orm import defer
+from sqlmodel import select
+from db import async_session
+from models import Summary, Diagnosis
+import metrics
+
+# Summaries fetched per query while exporting.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+# Rendered PDFs kept in memory, bounded by their total size.
+REPORT_CACHE_BYTES = int(os.getenv("REPORT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+_pdf_cache: OrderedDict[UUID, tuple[str | None, bytes]] = OrderedDict()
+_pdf_cache_bytes = 0
+
+####### Rendering #######
+
+# The core PDF fonts only cover Latin-1; common typographic characters outside
+# it are spelled in ASCII, anything else becomes "?".
+_LATIN1_FALLBACKS = str.maketrans({
+    "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u2022": "*", "\u2026": "...", "\u2264": "<=", "\u2265": ">=",
+})
+
+def _latin1(text) -> str:
+    return str(text).translate(_LATIN1_FALLBACKS).encode("latin-1", "replace").decode("latin-1")
+
+def _render_pdf(summary: Summary, diagnosis: Diagnosis | None) -> bytes:
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, "MedAgentX - Patient Case Report", ln=True, align="C")
+    pdf.ln(10)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, _latin1(f"Patient ID: {summary.patient_id}"), ln=True)
+    pdf.cell(0, 8, _latin1(f"File Name: {summary.file_name}"), ln=True)
+    pdf.cell(0, 8, f"Date: {summary.created_at.strftime('%Y-%m-%d')}", ln=True)
+    pdf.ln(5)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "Keywords:", ln=True)
+    pdf.set_font("Arial", "", 12)
+    pdf.multi_cell(0, 8, _latin1(', '.join(summary.keywords) if summary.keywords else "N/A"))
+    pdf.ln(5)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "Summary:", ln=True)
+    pdf.set_font("Arial", "", 12)
+    pdf.multi_cell(0, 8, _latin1(summary.summary if summary.summary else "N/A"))
+    pdf.ln(5)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "Diagnosis:", ln=True)
+    pdf.set_font("Arial", "", 12)
+    pdf.multi_cell(0, 8, _latin1(diagnosis.result if diagnosis else "N/A"))
+
+    return pdf.output(dest='S').encode('latin1')
+
+def render_txt(summary: Summary, diagnosis: Diagnosis | None) -> str:
+    return f"""Patient ID: {summary.patient_id}
+File Name: {summary.file_name}
+Uploaded: {summary.created_at.strftime('%Y-%m-%d')}
+
+Summary:
+{summary.summary}
+
+Notes:
+{summary.notes or 'N/A'}
+
+Diagnosis:
+{diagnosis.result if diagnosis else 'Diagnosis not available'}
+"""
+
+def report_name(summary: Summary, extension: str) -> str:
+    return f"{os.path.splitext(summary.file_name or 'summary')[0]}_report.{extension}"
+
+####### PDF cache #######
+
+def invalidate(summary_id: UUID):
+    """Forget the rendered PDF of a summary; called whenever its diagnosis changes."""
+    global _pdf_cache_bytes
+    cached = _pdf_cache.pop(summary_id, None)
+    if cached:
+        _pdf_cache_bytes -= len(cached[1])
+
+async def render_pdf(summary: Summary, diagnosis: Diagnosis | None) -> bytes:
+    """
+    PDF report of a summary, rendered in a worker thread and cached. Entries are
+    also keyed on the diagnosis timestamp, so a diagnosis written by another
+    process is never served stale.
+    """
+    global _pdf_cache_bytes
+    version = diagnosis.created_at.isoformat() if diagnosis else None
+    cached = _pdf_cache.get(summary.id)
+    if cached and cached[0] == version:
+        _pdf_cache.move_to_end(summary.id)
+        return cached[1]
+
+    pdf = await asyncio.to_thread(_render_pdf, summary, diagnosis)
+    invalidate(summary.id)
+    if len(pdf) <= REPORT_CACHE_BYTES:
+        _pdf_cache[summary.id] = (version, pdf)
+        _pdf_cache_bytes += len(pdf)
+        while _pdf_cache_bytes > REPORT_CACHE_BYTES:
+            _, (_, evicted) = _pdf_cache.popitem(last=False)
+            _pdf_cache_bytes -= len(evicted)
+    return pdf
+
+####### Bulk export #######
+
+async def iter_cases(doctor_id: UUID, patient_id: UUID | None = None, start: datetime | None = None, end: datetime | None = None):
+    """
+    Yield (summary, diagnosis) for the doctor's matching summaries, newest
+    first, fetching EXPORT_BATCH_SIZE rows per query on a (created_at, id)
+    keyset, so memory use does not depend on how many summaries match. No
+    export reads raw_text, so it is never loaded.
+    """
+    query = (
+        select(Summary, Diagnosis)
+        .options(defer(Summary.raw_text))
+        .outerjoin(Diagnosis, Diagnosis.summary_id == Summary.id)
+        .where(Summary.doctor_id == doctor_id)
+    )
+    if patient_id:
+        query = query.where(Summary.patient_id == patient_id)
+    if start:
+        query = query.where(Summary.created_at >= start)
+    if end:
+        query = query.where(Summary.created_at < end)
+    query = query.order_by(Summary.created_at.desc(), Summary.id.desc()).limit(EXPORT_BATCH_SIZE)
+
+    last = None
+    while True:
+        async with async_session() as session:
+            batch_query = query.where(tuple_(Summary.created_at, Summary.id) < tuple_(*last)) if last else query
+            rows = (await session.exec(batch_query)).all()
+        for summary, diagnosis in rows:
+            yield summary, diagnosis
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        last = (rows[-1][0].created_at, rows[-1][0].id)
+
+def _case_record(summary: Summary, diagnosis: Diagnosis | None) -> dict:
+    return {
+        "summary_id": str(summary.id),
+        "patient_id": str(summary.patient_id) if summary.patient_id else None,
+        "file_name": summary.file_name,
+        "created_at": summary.created_at.isoformat(),
+        "keywords": summary.keywords,
+        "summary": summary.summary,
+        "notes": summary.notes,
+        "diagnosis": diagnosis.result if diagnosis else None,
+        "diagnosed_at": diagnosis.created_at.isoformat() if diagnosis else None,
+    }
+
+CSV_COLUMNS = ["summary_id", "patient_id", "file_name", "created_at", "keywords", "summary", "notes", "diagnosis", "diagnosed_at"]
+
+async def stream_ndjson(cases):
+    async for summary, diagnosis in cases:
+        yield json.dumps(_case_record(summary, diagnosis)) + "\n"
+
+async def stream_csv(cases):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    async for summary, diagnosis in cases:
+        record = _case_record(summary, diagnosis)
+        record["keywords"] = ", ".join(record["keywords"] or [])
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable sink the zip writer appends to; drained after every member."""
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._data.extend(b)
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = bytes(self._data)
+        self._data.clear()
+        return data
+
+async def stream_zip(cases, report: str = "pdf"):
+    """Zip of one report per summary, streamed member by member. Cases that fail to render are logged and skipped."""
+    sink = _ZipSink()
+    used_names = set()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for summary, diagnosis in cases:
+            name = f"{summary.created_at.strftime('%Y-%m-%d')}_{str(summary.id)[:8]}_{report_name(summary, report)}"
+            if name in used_names:
+                name = f"{summary.id}_{report_name(summary, report)}"
+            used_names.add(name)
+            try:
+                if report == "pdf":
+                    data = await render_pdf(summary, diagnosis)
+                else:
+                    data = render_txt(summary, diagnosis).encode("utf-8")
+            except Exception as e:
+                # The response has already started, so one unrenderable case
+                # is left out rather than cutting the archive short.
+                metrics.log_event("export_render_failed", sampled=False, level=logging.ERROR, summary_id=str(summary.id), error=repr(e))
+                continue
+            archive.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
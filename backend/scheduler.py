@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+import metrics
+
+# Chat completions in flight at once per worker process.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# OpenAI requests and tokens per minute this worker process may use; 0 means
+# no limit. With several workers, split the account's limits between them.
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# How much faster interactive flows are served than batch ones while both are
+# waiting. Batch work gets all of the capacity nobody else is waiting for.
+WEIGHTS = {
+    INTERACTIVE: float(os.getenv("LLM_INTERACTIVE_WEIGHT", "10")),
+    BATCH: float(os.getenv("LLM_BATCH_WEIGHT", "1")),
+}
+# Seconds an interactive call waits for its turn before it fails with 503;
+# batch calls wait as long as it takes.
+MAX_WAIT = {
+    INTERACTIVE: float(os.getenv("LLM_INTERACTIVE_MAX_WAIT", "30")),
+    BATCH: None,
+}
+
+class QueueTimeout(Exception):
+    """A call waited MAX_WAIT without being started."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Timed out waiting for an LLM slot.")
+        self.retry_after = retry_after
+
+def request_tokens(messages: list[dict], max_tokens: int) -> int:
+    """Tokens a call may use before its usage is known: the prompt (~4 characters per token) plus max_tokens."""
+    return sum(len(message["content"]) for message in messages) // 4 + max_tokens
+
+class _Budget:
+    """Per-minute budget refilled continuously. Actual usage may exceed the estimate spent up front, leaving it in debt."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: int) -> float:
+        """Seconds until `amount` can be spent; a call larger than the whole budget runs once it is full."""
+        if not self.per_minute:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.per_minute)
+        return max(amount - self.level, 0) * 60 / self.per_minute
+
+    def spend(self, amount: int):
+        if self.per_minute:
+            self._refill()
+            self.level -= amount
+
+class Scheduler:
+    """
+    Start-time fair queueing of chat completions over flows, one flow per
+    doctor and priority. A call is tagged with a virtual start time, the later
+    of the current virtual time and the end of its flow's previous call, and
+    advances its flow by its estimated tokens divided by the priority's weight.
+    Calls start in tag order whenever a concurrency slot is free and the RPM
+    and TPM budgets allow, so a doctor's backlog of summaries takes turns with
+    everyone else rather than queueing ahead of them.
+    """
+
+    def __init__(self, max_concurrency: int, rpm: int, tpm: int):
+        self.max_concurrency = max_concurrency
+        self.requests = _Budget(rpm)
+        self.tokens = _Budget(tpm)
+        self._running = 0
+        # Waiting calls as (start tag, arrival, future, tokens).
+        self._waiting: list[tuple] = []
+        self._finish: dict[tuple, float] = {}
+        self._virtual = 0.0
+        self._arrivals = itertools.count()
+        self._wakeup: asyncio.TimerHandle | None = None
+
+    def _budget_wait(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _dispatch(self):
+        if self._wakeup:
+            self._wakeup.cancel()
+            self._wakeup = None
+        while self._waiting and self._running < self.max_concurrency:
+            start, _, future, tokens = self._waiting[0]
+            if future.done():
+                # Cancelled or timed out while waiting.
+                heapq.heappop(self._waiting)
+                continue
+            delay = self._budget_wait(tokens)
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiting)
+            self._virtual = start
+            self.requests.spend(1)
+            self.tokens.spend(tokens)
+            self._running += 1
+            future.set_result(None)
+
+    def _tag(self, flow: tuple, cost: float) -> float:
+        if len(self._finish) > 10_000:
+            # Flows that finished behind the virtual time would start from it anyway.
+            self._finish = {key: end for key, end in self._finish.items() if end > self._virtual}
+        start = max(self._virtual, self._finish.get(flow, 0.0))
+        self._finish[flow] = start + cost
+        return start
+
+    @asynccontextmanager
+    async def slot(self, doctor_id, priority: str, tokens: int):
+        """
+        Wait for the turn of this doctor's `priority` flow and hold a slot for
+        the block. Set usage["tokens"] to the tokens actually used so the TPM
+        budget is corrected. Raises QueueTimeout after MAX_WAIT[priority].
+        """
+        future = asyncio.get_running_loop().create_future()
+        start = self._tag((doctor_id, priority), tokens / WEIGHTS[priority])
+        heapq.heappush(self._waiting, (start, next(self._arrivals), future, tokens))
+        metrics.llm_queue_depth.inc(priority=priority)
+        queued = time.perf_counter()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, MAX_WAIT[priority])
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Started just as the wait gave up; hand the slot back.
+                self._release(tokens, tokens)
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.llm_queue_timeouts.inc(priority=priority)
+                raise QueueTimeout(max(self._budget_wait(tokens), 1)) from None
+            raise
+        finally:
+            metrics.llm_queue_depth.inc(-1, priority=priority)
+            metrics.llm_queue_wait.observe(time.perf_counter() - queued, priority=priority)
+
+        usage = {"tokens": tokens}
+        try:
+            yield usage
+        finally:
+            self._release(tokens, usage["tokens"])
+
+    def _release(self, estimated: int, used: int):
+        self._running -= 1
+        self.tokens.spend(used - estimated)
+        self._dispatch()
+
+scheduler = Scheduler(LLM_MAX_CONCURRENCY, LLM_RPM, LLM_TPM)
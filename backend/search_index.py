@@ -0,0 +1,114 @@
+import os
+from uuid import UUID
+from sqlalchemy import func, literal_column, tuple_
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Summary, SummaryKeyword
+import pagination
+
+NO_KEYWORDS = "No key medical terms found."
+
+# Characters of raw text ts_headline reads for a result's snippet. Matches past
+# this point still count, they are just not highlighted.
+SEARCH_HEADLINE_CHARS = int(os.getenv("SEARCH_HEADLINE_CHARS", "20000"))
+
+# Trigram indexes let substring LIKE filters use an index instead of scanning
+# every summary; keywords are matched through the summarykeyword side table
+# rather than by expanding each row's JSONB array. Applied by migrations.py.
+SEARCH_INDEX_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_summary_file_name_trgm ON summary USING gin (lower(file_name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_summarykeyword_keyword_trgm ON summarykeyword USING gin (keyword gin_trgm_ops)",
+    f"""
+    INSERT INTO summarykeyword (summary_id, keyword)
+    SELECT DISTINCT s.id, lower(kw)
+    FROM summary s CROSS JOIN LATERAL jsonb_array_elements_text(s.keywords) AS kw
+    WHERE jsonb_typeof(s.keywords) = 'array'
+      AND kw <> '{NO_KEYWORDS}'
+      AND NOT EXISTS (SELECT 1 FROM summarykeyword)
+    ON CONFLICT DO NOTHING
+    """,
+]
+
+# Full-text search. search_vector is a stored generated column, so Postgres
+# fills it on every insert and update: file names weigh most, then the
+# summary, then the document text. Only the first FULLTEXT_RAW_CHARS of raw
+# text are indexed, which keeps vectors under the 1 MB tsvector limit. Adding
+# the column rewrites the summary table once. Applied by migrations.py.
+FULLTEXT_RAW_CHARS = 200_000
+FULLTEXT_DDL = [
+    f"""
+    ALTER TABLE summary ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(file_name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(summary, '')), 'B') ||
+        setweight(to_tsvector('english', left(coalesce(raw_text, ''), {FULLTEXT_RAW_CHARS})), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_summary_search_vector ON summary USING gin (search_vector)",
+]
+
+# Not mapped on Summary, so loading a summary never reads the vector.
+_search_vector = literal_column("summary.search_vector")
+_config = literal_column("'english'::regconfig")
+_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+def keyword_rows(summary: Summary) -> list[SummaryKeyword]:
+    keywords = {kw.lower() for kw in summary.keywords or [] if kw != NO_KEYWORDS}
+    return [SummaryKeyword(summary_id=summary.id, keyword=kw) for kw in sorted(keywords)]
+
+def _like_pattern(term: str) -> str:
+    escaped = term.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def filter_summaries(query, file_name: str | None = None, patient_id: UUID | None = None, keyword: str | None = None):
+    """Apply the /summaries filters in a form the search indexes can serve."""
+    if file_name:
+        query = query.where(func.lower(Summary.file_name).like(_like_pattern(file_name), escape="\\"))
+
+    if patient_id:
+        query = query.where(Summary.patient_id == patient_id)
+
+    if keyword:
+        query = query.where(Summary.id.in_(
+            select(SummaryKeyword.summary_id).where(SummaryKeyword.keyword.like(_like_pattern(keyword), escape="\\"))
+        ))
+
+    return query
+
+async def search(session: AsyncSession, doctor_id: UUID, q: str, patient_id: UUID | None, limit: int, cursor: str | None = None) -> tuple[list[dict], str | None]:
+    """
+    One page of the doctor's summaries matching q, best match first, and the
+    cursor of the next page. q uses web search syntax: "quoted phrases", OR,
+    and -excluded words. Results are ranked with ts_rank_cd (normalized by
+    document length) and carry snippets of the summary and the document text
+    with the matches wrapped in <mark></mark>; the snippets are not HTML-escaped.
+    """
+    tsquery = func.websearch_to_tsquery(_config, q)
+    rank = func.ts_rank_cd(_search_vector, tsquery, 1)
+    query = (
+        select(Summary.id, Summary.patient_id, Summary.file_name, Summary.created_at, rank.label("rank"))
+        .where(Summary.doctor_id == doctor_id, _search_vector.op("@@")(tsquery))
+    )
+    if patient_id:
+        query = query.where(Summary.patient_id == patient_id)
+    if cursor:
+        after_rank, created_at, id = pagination.decode_rank_cursor(cursor)
+        query = query.where(tuple_(rank, Summary.created_at, Summary.id) < tuple_(after_rank, created_at, id))
+    page = query.order_by(rank.desc(), Summary.created_at.desc(), Summary.id.desc()).limit(limit + 1).subquery()
+
+    # Snippets are built for this page only; ts_headline re-parses the text it is given.
+    rows = (await session.exec(
+        select(
+            page.c.id, page.c.patient_id, page.c.file_name, page.c.created_at, page.c.rank,
+            func.ts_headline(_config, Summary.summary, tsquery, _HEADLINE_OPTIONS).label("summary_highlight"),
+            func.ts_headline(_config, func.left(Summary.raw_text, SEARCH_HEADLINE_CHARS), tsquery, _HEADLINE_OPTIONS).label("text_highlight"),
+        )
+        .join(Summary, Summary.id == page.c.id)
+        .order_by(page.c.rank.desc(), page.c.created_at.desc(), page.c.id.desc())
+    )).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_rank_cursor(rows[-1].rank, rows[-1].created_at, rows[-1].id)
+    return [row._asdict() for row in rows], next_cursor
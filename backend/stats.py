@@ -0,0 +1,48 @@
+import os
+import time
+from uuid import UUID
+from sqlalchemy import Integer, cast, func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import Summary, Diagnosis, Feedback
+
+# Seconds a doctor's dashboard numbers are served from memory. Writes that
+# change them call invalidate(), so the TTL only bounds staleness from other
+# worker processes.
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+
+_cache: dict[UUID, tuple[float, dict]] = {}
+
+def invalidate(doctor_id: UUID | None = None):
+    """Drop the cached stats of one doctor, or of everyone when doctor_id is None."""
+    if doctor_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(doctor_id, None)
+
+async def _compute(session: AsyncSession, doctor_id: UUID) -> dict:
+    own_summaries = select(Summary.id).where(Summary.doctor_id == doctor_id)
+    total_summaries = select(func.count()).select_from(Summary).where(Summary.doctor_id == doctor_id).scalar_subquery()
+    total_diagnoses = select(func.count()).select_from(Diagnosis).where(Diagnosis.summary_id.in_(own_summaries)).scalar_subquery()
+    feedback = (
+        select(func.count().label("total"), func.avg(cast(Feedback.helpful, Integer)).label("average"))
+        .where(Feedback.summary_id.in_(own_summaries))
+        .subquery()
+    )
+
+    row = (await session.exec(select(total_summaries, total_diagnoses, feedback.c.total, feedback.c.average))).one()
+    return {
+        "total_summaries": row[0],
+        "total_diagnoses": row[1],
+        "total_feedbacks": row[2],
+        "average_feedback": round(float(row[3]), 2) if row[3] is not None else "N/A",
+    }
+
+async def get_dashboard_stats(session: AsyncSession, doctor_id: UUID) -> dict:
+    """Counts of the doctor's summaries, diagnoses and feedback, plus the share of helpful feedback."""
+    cached = _cache.get(doctor_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    result = await _compute(session, doctor_id)
+    _cache[doctor_id] = (time.monotonic() + STATS_CACHE_TTL, result)
+    return result
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import re
+import llm
+from extraction import PAGE_BREAK
+
+SUMMARY_SYSTEM_PROMPT = "You are a helpful medical AI assistant that summarizes patient records concisely and professionally."
+
+# Token budget of a single chunk, and how many chunk summaries run at once.
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "8"))
+
+def estimate_tokens(text: str) -> int:
+    # Rough estimate for English clinical text (~4 characters per token).
+    return len(text) // 4 + 1
+
+def _split_oversized(text: str, max_tokens: int) -> list[str]:
+    lines = text.splitlines(keepends=True)
+    if len(lines) == 1:
+        step = max_tokens * 4
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    return _pack(lines, max_tokens, "")
+
+def _pack(pieces: list[str], max_tokens: int, sep: str) -> list[str]:
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if tokens > max_tokens:
+            if current:
+                chunks.append(sep.join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(piece, max_tokens))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(sep.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(sep.join(current))
+    return chunks
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> list[str]:
+    """
+    Split text into chunks of at most ~max_tokens. Chunks are cut on page and
+    paragraph boundaries; a paragraph is only cut by lines (or characters) when
+    it alone exceeds the budget.
+    """
+    paragraphs = [
+        p.strip()
+        for page in text.split(PAGE_BREAK)
+        for p in re.split(r"\n\s*\n", page)
+        if p.strip()
+    ]
+    return [c for c in _pack(paragraphs, max_tokens, "\n\n") if c.strip()]
+
+async def _complete(prompt: str, max_tokens: int, use_cache: bool, doctor_id, priority: str | None) -> str:
+    return await llm.chat_completion(
+        stage="summary",
+        max_tokens=max_tokens,
+        use_cache=use_cache,
+        doctor_id=doctor_id,
+        priority=priority,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+    )
+
+def _final_prompt(text: str, notes: str | None) -> str:
+    return f"""
+You are a medical assistant that reads raw patient documents and optional notes from the uploader, and produces a concise clinical summary.
+
+{f"Uploader's notes: {notes}" if notes else ""}
+Patient Notes:
+{text}
+
+Return only the summary. Do not include introductions or explanations.
+"""
+
+async def _summarize_chunk(chunk: str, semaphore: asyncio.Semaphore, use_cache: bool, doctor_id, priority: str | None) -> str:
+    # Chunk prompts do not depend on the uploader's notes, so unchanged chunks
+    # are answered from llm_cache when a document is summarized again.
+    prompt = f"""
+The following is one section of a longer patient document. Summarize it for a clinician, keeping every clinically relevant detail: diagnoses, symptoms, medications and doses, lab and imaging results, procedures and dates.
+
+Section:
+{chunk}
+
+Return only the summary of this section.
+"""
+    async with semaphore:
+        return (await _complete(prompt, 500, use_cache, doctor_id, priority)).strip()
+
+async def _reduce_to_budget(text: str, use_cache: bool, doctor_id, priority: str | None) -> str:
+    chunks = chunk_text(text)
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    while len(chunks) > 1:
+        partials = await asyncio.gather(*(_summarize_chunk(chunk, semaphore, use_cache, doctor_id, priority) for chunk in chunks))
+        reduced = _pack(list(partials), CHUNK_TOKENS, "\n\n")
+        if len(reduced) >= len(chunks):
+            chunks = partials
+            break
+        chunks = reduced
+    return "\n\n".join(chunks)
+
+def _final_messages(text: str, notes: str | None) -> list[dict]:
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": _final_prompt(text, notes)},
+    ]
+
+async def summarize_document(text: str, notes: str | None = None, use_cache: bool = True, doctor_id=None, priority: str | None = None) -> str:
+    """
+    Map-reduce summary of a whole document. Short documents take a single call;
+    longer ones are chunked, the chunks summarized concurrently, and the partial
+    summaries reduced (repeatedly, if they still exceed one chunk) into the final one.
+    Every call is scheduled in doctor_id's flow, at the summary stage's priority
+    unless `priority` is given.
+    """
+    reduced = await _reduce_to_budget(text, use_cache, doctor_id, priority)
+    return await llm.chat_completion(
+        stage="summary",
+        messages=_final_messages(reduced, notes),
+        use_cache=use_cache,
+        doctor_id=doctor_id,
+        priority=priority,
+    )
+
+async def stream_document_summary(text: str, notes: str | None = None, use_cache: bool = True, doctor_id=None, priority: str | None = None):
+    """Same as summarize_document, but yields the final summary as it is generated."""
+    reduced = await _reduce_to_budget(text, use_cache, doctor_id, priority)
+    async for delta in llm.stream_chat_completion(
+        stage="summary",
+        messages=_final_messages(reduced, notes),
+        use_cache=use_cache,
+        doctor_id=doctor_id,
+        priority=priority,
+    ):
+        yield delta
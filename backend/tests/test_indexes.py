@@ -0,0 +1,24 @@
+"""
+Every hot lookup in migrations.HOT_QUERIES must be served by its index. Needs
+a Postgres database in DATABASE_URL; the app's migrations are applied to it first.
+"""
+import asyncio
+import os
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from db import engine, init_db
+import migrations
+
+def test_hot_queries_use_their_indexes():
+    async def check() -> dict[str, str]:
+        await init_db()
+        try:
+            return await migrations.check_indexes(engine)
+        finally:
+            await engine.dispose()
+
+    failures = asyncio.run(check())
+    assert not failures, "\n\n".join(f"{name} does not use its index:\n{plan}" for name, plan in failures.items())
@@ -0,0 +1,50 @@
+"""
+Reports must render whatever text a summary holds: the PDF core fonts only
+cover Latin-1, and a zip export that has already started cannot report an error.
+"""
+import asyncio
+import io
+import uuid
+import zipfile
+from models import Diagnosis, Summary
+import reports
+
+def _case(text: str) -> tuple[Summary, Diagnosis]:
+    summary = Summary(
+        doctor_id=uuid.uuid4(),
+        patient_id=uuid.uuid4(),
+        file_name="Müller – labs.pdf",
+        summary=text,
+        keywords=["hba1c ≥ 6.5%"],
+    )
+    return summary, Diagnosis(summary_id=summary.id, result=f"Type 2 diabetes – {text}")
+
+async def _cases(*cases):
+    for case in cases:
+        yield case
+
+async def _collect(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+def test_pdf_renders_text_outside_latin1():
+    summary, diagnosis = _case("BP 140–150 mmHg, “stable”, 血糖 high")
+    pdf = asyncio.run(reports.render_pdf(summary, diagnosis))
+    assert pdf.startswith(b"%PDF")
+
+def test_zip_skips_cases_that_fail_to_render(monkeypatch):
+    good, bad = _case("Stable – no change"), _case("Unrenderable")
+    render_pdf = reports.render_pdf
+
+    async def flaky_render_pdf(summary, diagnosis):
+        if summary is bad[0]:
+            raise RuntimeError("render failed")
+        return await render_pdf(summary, diagnosis)
+
+    monkeypatch.setattr(reports, "render_pdf", flaky_render_pdf)
+    data = asyncio.run(_collect(reports.stream_zip(_cases(bad, good))))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+    assert len(names) == 1
+    assert str(good[0].id)[:8] in names[0]
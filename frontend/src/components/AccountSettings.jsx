@@ -13,9 +13,12 @@ export default function AccountSettings({ doctor, refreshDoctor, close }) {
             const payload = { username, email };
             if (password) payload.password = password;
 
-            await axios.put('http://localhost:8000/account/update', payload, {
+            const res = await axios.put('http://localhost:8000/account/update', payload, {
                 headers: { Authorization: `Bearer ${localStorage.getItem("token")}` }
             });
+            if (res.data.access_token) {
+                localStorage.setItem("token", res.data.access_token);
+            }
 
             setMessage('Account updated successfully!');
             refreshDoctor();
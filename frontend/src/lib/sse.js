@@ -0,0 +1,47 @@
+// POSTs to a streaming endpoint and calls onEvent(event, data) for every
+// Server-Sent Event. axios buffers the whole response, so this uses fetch.
+export async function postSSE(url, body, onEvent) {
+    const token = localStorage.getItem("token");
+    const isForm = body instanceof FormData;
+
+    const response = await fetch(url, {
+        method: "POST",
+        headers: {
+            ...(token ? { Authorization: `Bearer ${token}` } : {}),
+            ...(isForm ? {} : { "Content-Type": "application/json" }),
+        },
+        body: isForm ? body : JSON.stringify(body),
+    });
+    if (!response.ok) {
+        throw new Error(`Request failed with status ${response.status}`);
+    }
+    if (response.headers.get("Content-Type")?.includes("application/json")) {
+        const data = await response.json();
+        onEvent(data.error ? "error" : "message", data.error ? { detail: data.error } : data);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = "message";
+            let data = "";
+            for (const line of raw.split("\n")) {
+                if (line.startsWith("event: ")) event = line.slice(7);
+                else if (line.startsWith("data: ")) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
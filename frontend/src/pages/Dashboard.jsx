@@ -14,6 +14,9 @@ function Dashboard() {
 	const [page, setPage] = useState(1);
 	const [perPage] = useState(10);;
 	const [total, setTotal] = useState(0);
+	// cursors[i] fetches page i + 1; the first page has no cursor.
+	const [cursors, setCursors] = useState([null]);
+	const [nextCursor, setNextCursor] = useState(null);
 
 	const [activeTag, setActiveTag] = useState("");
 
@@ -47,15 +50,24 @@ function Dashboard() {
 
 	useEffect(() => {
 		setPage(1);
+		setCursors([null]);
 	}, [searchField, searchTerm]);
 
+	const goToNextPage = () => {
+		if (!nextCursor) return;
+		setCursors((c) => [...c.slice(0, page), nextCursor]);
+		setPage((p) => p + 1);
+	};
+
 	useEffect(() => {
 		const fetchSummaries = async () => {
 			try {
 				const params = {
-					page: page,
 					per_page: perPage,
 				};
+				if (cursors[page - 1]) {
+					params.cursor = cursors[page - 1];
+				}
 				if (searchTerm.trim()) {
 					params[searchField] = searchTerm.trim();
 				}
@@ -65,6 +77,7 @@ function Dashboard() {
 				});
 				setSummaries(response.data.summaries);
 				setTotal(response.data.total);
+				setNextCursor(response.data.next_cursor);
 			} catch (error) {
 				console.error("Failed to fetch summaries", error);
 			} finally {
@@ -73,7 +86,7 @@ function Dashboard() {
 		};
 
 		fetchSummaries();
-	}, [searchTerm, searchField, page]);
+	}, [searchTerm, searchField, page, cursors]);
 
 	useEffect(() => {
 		window.scrollTo({ top: 0, behavior: 'smooth' });
@@ -108,6 +121,7 @@ function Dashboard() {
 								setActiveTag("");
 								setSearchTerm("");
 								setPage(1);
+								setCursors([null]);
 								// window.scrollTo({ top: 0, behavior: 'smooth' });
 							}}
 							className="px-3 py-1 bg-gray-200 rounded text-sm hover:bg-gray-300 transition"
@@ -168,19 +182,12 @@ function Dashboard() {
 							Page {page} of {totalPages}
 						</span>
 						<button
-							onClick={() => setPage((p) => (p < totalPages ? p + 1 : p))}
-							disabled={page >= totalPages}
+							onClick={goToNextPage}
+							disabled={!nextCursor}
 							className="px-3 py-1 border rounded hover:bg-blue-100 disabled:opacity-50"
 						>
 							Next
 						</button>
-						<button
-							onClick={() => setPage(totalPages)}
-							disabled={page >= totalPages}
-							className="px-3 py-1 border rounded hover:bg-blue-100 disabled:opacity-50"
-						>
-							Last
-						</button>
 					</div>
 				)}
 			</div>
@@ -22,6 +22,21 @@ export default function PatientDetails() {
                 });
         }
     };
+    const handleExport = (format) => {
+        axios.get("http://localhost:8000/export", { params: { patient_id: id, format }, responseType: "blob" })
+            .then((res) => {
+                const url = URL.createObjectURL(res.data);
+                const link = document.createElement("a");
+                link.href = url;
+                link.download = `patient_${id}.${format}`;
+                link.click();
+                URL.revokeObjectURL(url);
+            })
+            .catch((err) => {
+                console.error(err);
+                alert("An error occurred while exporting the case file.");
+            });
+    };
     useEffect(() => {
         const fetchPatientData = async () => {
             try {
@@ -60,6 +75,12 @@ export default function PatientDetails() {
                 >
                     Delete Patient
                 </button>
+                <button onClick={() => handleExport("zip")} className="bg-green-600 hover:bg-green-700 text-white px-4 py-2 rounded">
+                    Export Case File
+                </button>
+                <button onClick={() => handleExport("csv")} className="border px-4 py-2 rounded hover:bg-gray-100">
+                    Export CSV
+                </button>
             </div>
 
 
@@ -4,9 +4,19 @@ import { Link } from "react-router-dom";
 
 export default function Patients(){
     const [patients, setPatients] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+
+    const fetchPatients = (cursor = null) => {
+        axios.get("http://localhost:8000/patients", { params: cursor ? { cursor } : {} })
+            .then(res => {
+                setPatients(prev => cursor ? [...prev, ...res.data] : res.data);
+                setNextCursor(res.headers["x-next-cursor"] || null);
+            })
+            .catch(err => console.error("Error fetching patients: ", err));
+    };
 
     useEffect(() => {
-        axios.get("http://localhost:8000/patients").then(res => setPatients(res.data)).catch(err => console.error("Error fetching patients: ", err));
+        fetchPatients();
     }, [])
 
     return (
@@ -23,6 +33,11 @@ export default function Patients(){
                     </div>
                 ))}
             </div>
+            {nextCursor && (
+                <button onClick={() => fetchPatients(nextCursor)} className="mt-4 px-4 py-2 border rounded hover:bg-blue-100">
+                    Load more
+                </button>
+            )}
         </div>
     );
 }
\ No newline at end of file
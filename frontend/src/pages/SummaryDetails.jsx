@@ -3,6 +3,7 @@ import { useParams } from "react-router-dom";
 import axios from "axios";
 import DiagnosisHistory from "@/components/DiagnosisHistory";
 import RecommendationHistory from "@/components/RecommendationHistory";
+import { postSSE } from "@/lib/sse";
 
 function SummaryDetail() {
     const { id } = useParams();
@@ -30,36 +31,18 @@ function SummaryDetail() {
     useEffect(() => {
         const fetchSummary = async () => {
             try {
-                const res = await axios.get(`http://localhost:8000/summaries/${id}`);
-                setSummary(res.data);
-                if (res.data?.id) {
-                    await axios.get(`http://localhost:8000/diagnosis/${res.data.id}`)
-                        .then((response) => {
-                            if (response.data?.diagnosis) {
-                                setDiagnosis(response.data.diagnosis);
-                                setDiagnosisDate(response.data.created_at);
-                            }
-                        })
-                        .catch((err) => {
-                            console.error("Error fetching diagnosis:", err);
-                        });
-
-                    await axios.get(`http://127.0.0.1:8000/feedback/${res.data.id}`).then((response) => {
-                        if (response.data?.id) {
-                            setSubmittedFeedback(response.data);
-                        }
-                    }).catch((err) => {
-                        console.error("Error fetching feedback:", err);
-                    });
-                    await axios.get(`http://localhost:8000/diagnoses/${res.data.id}`).then((response) => {
-                        setDiagnosisHistory(response.data || []);
-                    }).catch((err) => {
-                        console.error("Error fetching diagnosis history:", err);
-                    });
-                    await axios.get(`http://localhost:8000/recommendations/${id}`).then((res) => setRecommendationHistory(res.data)).catch((err) => {
-                        console.error("Error fetching recommendations:", err);
-                    });
+                const res = await axios.get(`http://localhost:8000/case/${id}`);
+                const { summary, diagnosis, diagnosis_history, recommendations, feedback } = res.data;
+                setSummary(summary);
+                if (diagnosis?.diagnosis) {
+                    setDiagnosis(diagnosis.diagnosis);
+                    setDiagnosisDate(diagnosis.created_at);
                 }
+                if (feedback?.id) {
+                    setSubmittedFeedback(feedback);
+                }
+                setDiagnosisHistory(diagnosis_history || []);
+                setRecommendationHistory(recommendations || []);
             } catch (err) {
                 console.error("Error fetching summary:", err);
             } finally {
@@ -75,12 +58,23 @@ function SummaryDetail() {
         setDiagnosis(null);
 
         try {
-            const res = await axios.post("http://localhost:8000/diagnose", {
-                summary: summary.summary,
+            let text = "";
+            // Regenerating must not be answered from the server-side LLM cache.
+            const noCache = diagnosis ? "?no_cache=true" : "";
+            await postSSE(`http://localhost:8000/diagnose/stream${noCache}`, {
                 summary_id: summary.id,
+            }, (event, data) => {
+                if (event === "error") throw new Error(data.detail);
+                if (event === "done") {
+                    setDiagnosis(data.diagnosis);
+                    setDiagnosisDate(data.created_at);
+                    return;
+                }
+                text += data.delta;
+                setDiagnosis(text);
             });
-            setDiagnosis(res.data.diagnosis);
-            setDiagnosisDate(new Date());
+            const historyRes = await axios.get(`http://localhost:8000/diagnoses/${summary.id}`);
+            setDiagnosisHistory(historyRes.data || []);
         } catch (err) {
             console.error("Diagnosis failed:", err);
             setDiagnosis("Failed to generate diagnosis.");
@@ -118,12 +112,15 @@ function SummaryDetail() {
 
         setLoadingRecommendations(true);
         try {
-            const response = await axios.post('http://localhost:8000/recommendations', {
+            let text = "";
+            const noCache = recommendationHistory.length > 0 ? "?no_cache=true" : "";
+            await postSSE(`http://localhost:8000/recommendations/stream${noCache}`, {
                 summary_id: summary.id,
-                summary: summary.summary,
-                diagnosis: diagnosis
+            }, (event, data) => {
+                if (event === "error") throw new Error(data.detail);
+                text = event === "done" ? data.recommendations : text + data.delta;
+                setRecommendations(text);
             });
-            setRecommendations(response.data.recommendations);
 
             const historyRes = await axios.get(`http://localhost:8000/recommendations/${summary.id}`);
             setRecommendationHistory(historyRes.data || []);
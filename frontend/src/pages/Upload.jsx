@@ -1,6 +1,7 @@
 import { useEffect, useState } from "react";
 import axios from "axios";
 import AddPatientModal from "../components/AddPatientModal";
+import { postSSE } from "../lib/sse";
 
 function Upload() {
 	const [file, setFile] = useState(null);
@@ -11,13 +12,20 @@ function Upload() {
 
 	const [loading, setLoading] = useState(false);
 	const [summary, setSummary] = useState(null);
+	const [fullCase, setFullCase] = useState(false);
+	const [caseResult, setCaseResult] = useState(null);
 
 	const [isModalOpen, setIsModalOpen] = useState(false);
 
-	useEffect(() => {
-		axios.get("http://localhost:8000/patients")
+	// /patients is paged; the picker needs every patient, so it uses the slim options list.
+	const fetchPatients = () => {
+		axios.get("http://localhost:8000/patients/options")
 			.then((res) => setPatients(res.data))
 			.catch(err => console.error("Error fetching patients: ", err));
+	};
+
+	useEffect(() => {
+		fetchPatients();
 	}, [])
 
 	const handleSubmit = async (e) => {
@@ -26,6 +34,7 @@ function Upload() {
 
 		setLoading(true);
 		setSummary(null);
+		setCaseResult(null);
 
 		if (!selectedPatient) {
 			alert("Please select a patient before uploading.");
@@ -37,15 +46,44 @@ function Upload() {
 		formData.append("patient_id", selectedPatient);
 		formData.append("notes", notes);
 
+		if (fullCase) {
+			try {
+				// Summary, diagnosis and recommendations all run on the server; each arrives as its stage is stored.
+				await postSSE("http://127.0.0.1:8000/pipeline", formData, (event, data) => {
+					if (event === "error") throw new Error(data.detail);
+					if (event === "summary") {
+						setLoading(false);
+						setSummary({ text: data.summary, keywords: data.keywords });
+					} else if (event === "diagnosis") {
+						setCaseResult(prev => ({ ...prev, diagnosis: data.diagnosis }));
+					} else if (event === "recommendations") {
+						setCaseResult(prev => ({ ...prev, recommendations: data.recommendations }));
+					}
+				});
+			} catch (err) {
+				console.error(err);
+				alert("Something went wrong!");
+			} finally {
+				setLoading(false);
+			}
+			return;
+		}
+
 		try {
-			const response = await axios.post("http://127.0.0.1:8000/generate-summary", formData, {
-				headers: {
-					"Content-Type": "multipart/form-data",
-				},
-			});
-			setSummary({
-				text: response.data.summary,
-				keywords: response.data.keywords,
+			let keywords = [];
+			let text = "";
+			await postSSE("http://127.0.0.1:8000/generate-summary/stream", formData, (event, data) => {
+				if (event === "keywords") {
+					keywords = data.keywords;
+				} else if (event === "done") {
+					text = data.summary;
+				} else if (event === "error") {
+					throw new Error(data.detail);
+				} else {
+					text += data.delta;
+				}
+				setLoading(false);
+				setSummary({ text, keywords });
 			});
 		} catch (err) {
 			console.error(err),
@@ -96,12 +134,7 @@ function Upload() {
 				<AddPatientModal
 					isOpen={isModalOpen}
 					onClose={() => setIsModalOpen(false)}
-					onPatientAdded={() => {
-						// Refresh patient list
-						axios.get("http://localhost:8000/patients")
-							.then((res) => setPatients(res.data))
-							.catch(err => console.error("Error fetching patients: ", err));
-					}}
+					onPatientAdded={fetchPatients}
 				/>
 
 				<div>
@@ -115,6 +148,11 @@ function Upload() {
 					></textarea>
 				</div>
 
+				<label className="flex items-center gap-2 text-gray-700">
+					<input type="checkbox" checked={fullCase} onChange={(e) => setFullCase(e.target.checked)} />
+					Also generate diagnosis and recommendations
+				</label>
+
 				<div>
 					<button
 						type="submit"
@@ -180,6 +218,19 @@ function Upload() {
 							</span>
 						))}
 					</div>
+
+					{caseResult?.diagnosis && (
+						<>
+							<h4 className="text-lg font-semibold text-gray-800 mt-6 mb-2">🩺 Diagnosis</h4>
+							<p className="text-gray-700 leading-relaxed whitespace-pre-line">{caseResult.diagnosis}</p>
+						</>
+					)}
+					{caseResult?.recommendations && (
+						<>
+							<h4 className="text-lg font-semibold text-gray-800 mt-6 mb-2">💡 Recommendations</h4>
+							<p className="text-gray-700 leading-relaxed whitespace-pre-line">{caseResult.recommendations}</p>
+						</>
+					)}
 				</div>
 			)}
 		</div>